@@ -0,0 +1,81 @@
+"""A parser object for multi-threaded servers.
+
+`AddressParser` pins one gazetteer, with its scanner, and one NER session
+for all its calls and may be shared by any number of threads:
+
+    address_parser = AddressParser(cascade=True)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(address_parser.parse, addresses))
+
+The gazetteer is never modified once built, so the rule and fuzzy stages
+run in the calling threads side by side. Model calls go through a
+`ner.BatchingBackend`: the NER of concurrent parses is merged into batches
+and run one batch at a time on a single worker thread, so one process
+holds one copy of the model however many threads use it. Parsers sharing
+a backend each batch their own calls but take turns on the model.
+
+The gazetteer stays the one the parser was created with, whatever
+`parser.reload_gazetteer` swaps in later; create a new `AddressParser` to
+pick up new data.
+"""
+from contextlib import contextmanager
+
+import parser
+from ner import BatchingBackend, get_backend, using_backend
+from result import ParsedAddress
+from scanner import get_scanner, using_scanner
+
+
+class AddressParser:
+    """Thread-safe `parse_address` / `parse_addresses` over fixed data.
+
+    `gazetteer` defaults to the active one and `backend` to the process-wide
+    NER backend, wrapped in a `BatchingBackend` that merges the calls of
+    up to `max_batch_size` texts arriving within `max_wait_ms`.
+    """
+
+    def __init__(self, gazetteer=None, backend=None, cascade=False, max_batch_size=32, max_wait_ms=2.0):
+        self.gazetteer = gazetteer or parser._active_gazetteer()
+        backend = backend or get_backend()
+        self._owns_backend = not isinstance(backend, BatchingBackend)
+        if self._owns_backend:
+            backend = BatchingBackend(backend, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        self.backend = backend
+        self.cascade = cascade
+        # Kept for the parser's lifetime; the module keeps only the scanners
+        # of the last two gazetteers
+        self.scanner = get_scanner(self.gazetteer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Stop the batching thread this parser started, if any"""
+        if self._owns_backend:
+            self.backend.close()
+
+    def load(self):
+        """Load the NER model now instead of on the first parse"""
+        self.backend.load()
+
+    @contextmanager
+    def _session(self):
+        token = parser._pinned_gazetteer.set(self.gazetteer)
+        try:
+            with using_backend(self.backend), using_scanner(self.scanner):
+                yield
+        finally:
+            parser._pinned_gazetteer.reset(token)
+
+    def parse(self, address: str) -> ParsedAddress:
+        """Parse one address, see `parser.parse_address`"""
+        with self._session():
+            return parser.parse_address(address, cascade=self.cascade)
+
+    def parse_many(self, addresses, batch_size=32) -> list[ParsedAddress]:
+        """Parse a list of addresses in batches, see `parser.parse_addresses`"""
+        with self._session():
+            return list(parser.parse_addresses(addresses, batch_size=batch_size, cascade=self.cascade))
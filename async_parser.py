@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import parser
+from result import ParsedAddress
+
+
+def _parse_batch(addresses, batch_size, cascade):
+    return list(parser.parse_addresses(addresses, batch_size=batch_size, cascade=cascade))
+
+
+def _same_context(a, b):
+    # Whether two captured contexts hold the same values, so that their
+    # requests can share one batch
+    return a is b or (len(a) == len(b) and all(var in b and b[var] is value for var, value in a.items()))
+
+
+def _context_groups(batch):
+    # Runs of consecutive requests captured in the same context
+    groups = []
+    for request in batch:
+        if groups and _same_context(groups[-1][0][1], request[1]):
+            groups[-1].append(request)
+        else:
+            groups.append([request])
+    return groups
+
+
+def _fail(requests, exc):
+    for _, _, future in requests:
+        if not future.done():
+            future.set_exception(exc)
+
+
+class AsyncAddressParser:
+    """Micro-batching asyncio front end for `parser.parse_addresses`.
+
+    Concurrent `parse()` calls are queued and grouped into batches of at most
+    `max_batch_size` addresses, waiting no longer than `max_wait_ms` after
+    the first one arrives. Each batch runs on `executor` (one worker thread
+    by default, a ProcessPoolExecutor works too) so NER never blocks the
+    event loop, and every caller's future is resolved with its own result.
+
+        async with AsyncAddressParser(max_batch_size=64, max_wait_ms=5) as p:
+            result = await p.parse("Phường 5, Quận 3, TP. Hồ Chí Minh")
+
+    A batch runs in the context of the `parse()` calls it serves, so a
+    pinned gazetteer, `ner.using_backend` or `instrumentation.recording`
+    around the call applies as it would to `parser.parse_address`; calls
+    made in differing contexts are not batched together. Contexts don't
+    reach the worker processes of a ProcessPoolExecutor.
+    """
+
+    def __init__(self, max_batch_size=32, max_wait_ms=5.0, executor=None, cascade=False):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.cascade = cascade
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._queue = None
+        self._worker = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        if self._worker is not None:
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="address-parser")
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self, drain=False):
+        """Stop the worker.
+
+        Requests still queued fail with RuntimeError, unless `drain` waits
+        for them to be parsed first.
+        """
+        if self._worker is None:
+            return
+
+        if drain and not self._worker.done():
+            await self._queue.join()
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        except BaseException:
+            # The worker already died; its requests have been failed
+            pass
+        self._worker = None
+
+        self._fail_queued(RuntimeError("AsyncAddressParser was closed"))
+
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _fail_queued(self, exc):
+        while not self._queue.empty():
+            _fail([self._queue.get_nowait()], exc)
+            self._queue.task_done()
+
+    async def parse(self, address: str) -> ParsedAddress:
+        if self._worker is None:
+            await self.start()
+        elif self._worker.done():
+            exc = None if self._worker.cancelled() else self._worker.exception()
+            raise RuntimeError("AsyncAddressParser worker has stopped") from exc
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((address, contextvars.copy_context(), future))
+        return await future
+
+    async def parse_many(self, addresses) -> list[ParsedAddress]:
+        return await asyncio.gather(*(self.parse(address) for address in addresses))
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            requests = await self._next_batch()
+            try:
+                await self._run_batch([request for request in requests if not request[2].cancelled()])
+            except asyncio.CancelledError:
+                _fail(requests, RuntimeError("AsyncAddressParser was closed"))
+                raise
+            except BaseException as e:
+                # Nothing will serve later requests, fail them too
+                _fail(requests, e)
+                self._fail_queued(e)
+                raise
+            finally:
+                for _ in requests:
+                    self._queue.task_done()
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        for group in _context_groups(batch):
+            parse_batch = partial(
+                _parse_batch,
+                [address for address, _, _ in group],
+                self.max_batch_size,
+                self.cascade,
+            )
+            if not isinstance(self._executor, ProcessPoolExecutor):
+                parse_batch = partial(group[0][1].run, parse_batch)
+            try:
+                results = await loop.run_in_executor(self._executor, parse_batch)
+            except Exception as e:
+                _fail(group, e)
+                continue
+
+            for (_, _, future), result in zip(group, results):
+                if not future.done():
+                    future.set_result(result)
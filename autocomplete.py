@@ -0,0 +1,212 @@
+"""Prefix completion of province, district and ward names as the user types.
+
+    complete("ben th", level="ward", province="hồ chí minh")
+    [Completion(level='ward', id=410, name='phường bến thành', province_id=4, matched='ben thanh')]
+
+Every unit is indexed under its full name, its name without the admin
+prefix ("phường", "quận", ...) and each of its later words, so "thanh"
+also completes to "bến thành". Queries typed without diacritics match the
+de-accented spellings, queries with diacritics only the accented ones.
+The province level also knows the `SPECIAL_PROVINCE_MAP` aliases.
+
+Completions rank names matching from their start before names matching
+at a later word, then shorter names first. The spellings are kept in
+sorted arrays, one per level and per province, so a keystroke is a binary
+search plus picking the best few ranks of the matching slice. Nothing of
+the NER pipeline is loaded.
+"""
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache
+
+from data import SPECIAL_PROVINCE_MAP_FULL
+from gazetteer import LEVELS, LEVEL_PREFIX_REGEX, load_gazetteer
+from utils import normalize_string, normalize_vietnamese
+
+# `matched` is the indexed spelling the query is a prefix of
+Completion = namedtuple("Completion", "level id name province_id matched")
+
+# Sorts after every character of the data, for the end of a prefix range
+_PREFIX_END = "\U0010ffff"
+
+_NON_WORD_REGEX = re.compile(r"\W+")
+
+
+class PrefixIndex:
+    """Sorted spellings of a set of units, for ranked prefix lookups"""
+
+    __slots__ = ("keys", "ranks", "units", "spellings")
+
+    def __init__(self, spellings):
+        """`spellings` are (spelling, order, unit ID), lower orders ranking first"""
+        spellings = sorted(spellings, key=lambda spelling: spelling[1])
+        self.units = array("I", (unit_id for _, _, unit_id in spellings))
+        self.spellings = tuple(spelling for spelling, _, _ in spellings)
+
+        # Positions in rank order, sorted by spelling
+        by_spelling = sorted(range(len(spellings)), key=self.spellings.__getitem__)
+        self.keys = [self.spellings[rank] for rank in by_spelling]
+        self.ranks = array("I", by_spelling)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def complete(self, prefix, limit):
+        """The best `limit` (unit ID, spelling) pairs with a spelling starting with `prefix`"""
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _PREFIX_END, lo)
+        ranks = self.ranks[lo:hi]
+
+        # A unit can match under several spellings, so take a few more
+        # ranks than needed and widen if duplicates ate into them
+        n = 2 * limit
+        while True:
+            best = sorted(ranks) if n >= len(ranks) else heapq.nsmallest(n, ranks)
+            found = []
+            seen = set()
+            for rank in best:
+                unit_id = self.units[rank]
+                if unit_id not in seen:
+                    seen.add(unit_id)
+                    found.append((unit_id, self.spellings[rank]))
+                    if len(found) == limit:
+                        return found
+            if n >= len(ranks):
+                return found
+            n *= 4
+
+
+def _name_spellings(name, prefix_regex):
+    # (accented, spelling, kind): kind 0 matches from the start of the
+    # name, kind 1 from a later word
+    for accented, form in ((True, name), (False, normalize_vietnamese(name))):
+        stripped = prefix_regex.sub("", form) or form
+        yield accented, form, 0
+        if stripped != form:
+            yield accented, stripped, 0
+        words = stripped.split()
+        for i in range(1, len(words)):
+            yield accented, " ".join(words[i:]), 1
+
+
+def _compact(name):
+    return _NON_WORD_REGEX.sub("", normalize_vietnamese(name))
+
+
+def _province_aliases(gazetteer):
+    # The aliases name provinces in their own spelling ("ĐắkLắk"), so they
+    # are resolved ignoring spaces and punctuation
+    provinces = {}
+    for province_id, name in enumerate(gazetteer.province_names):
+        provinces.setdefault(_compact(LEVEL_PREFIX_REGEX["province"].sub("", name)), province_id)
+    for alias, province in SPECIAL_PROVINCE_MAP_FULL.items():
+        province_id = provinces.get(_compact(normalize_string(province)))
+        if province_id is not None:
+            yield alias, province_id
+
+
+class Autocompleter:
+    """Completions over one gazetteer; indexes are built on first use"""
+
+    def __init__(self, gazetteer=None):
+        self.gazetteer = gazetteer or load_gazetteer()
+        self._indexes = {}
+
+    def _build(self, level, province_id):
+        gazetteer = self.gazetteer
+        if level == "province":
+            unit_ids = range(gazetteer.count("province"))
+        elif province_id is None:
+            unit_ids = range(gazetteer.count(level))
+        else:
+            unit_ids = gazetteer.children(level, province_id)
+
+        spellings = {True: [], False: []}
+        for unit_id in unit_ids:
+            name = gazetteer.name(level, unit_id)
+            for accented, spelling, kind in _name_spellings(name, LEVEL_PREFIX_REGEX[level]):
+                spellings[accented].append((spelling, (kind, len(name), name, unit_id), unit_id))
+        if level == "province":
+            for alias, unit_id in _province_aliases(gazetteer):
+                name = gazetteer.name(level, unit_id)
+                spellings[False].append((alias, (0, len(name), name, unit_id), unit_id))
+
+        return PrefixIndex(spellings[True]), PrefixIndex(spellings[False])
+
+    def index(self, level, province_id=None):
+        """(accented, de-accented) `PrefixIndex` of a level, optionally of one province"""
+        if level == "province":
+            province_id = None
+        key = (level, province_id)
+        indexes = self._indexes.get(key)
+        if indexes is None:
+            indexes = self._indexes[key] = self._build(level, province_id)
+        return indexes
+
+    def province_id(self, province):
+        """The ID of `province` (an ID or a name spelled exactly), None if unknown"""
+        if province is None:
+            return None
+        if isinstance(province, int):
+            return province if 0 <= province < self.gazetteer.count("province") else None
+        for key in (normalize_string(province), normalize_vietnamese(province)):
+            province_id = self.gazetteer.province_id(key)
+            if province_id is not None:
+                return province_id
+        return None
+
+    def complete(self, query, level="ward", province=None, limit=10):
+        """The best `limit` `Completion`s of `query` at `level`.
+
+        `province` (an ID or a name spelled exactly) restricts districts
+        and wards to that province; an unknown province completes nothing.
+        """
+        if level not in LEVELS:
+            raise ValueError(f"unknown level {level!r}, expected one of {LEVELS}")
+
+        prefix = normalize_string(query)
+        if not prefix or limit <= 0:
+            return []
+
+        province_id = self.province_id(province)
+        if province is not None and province_id is None:
+            return []
+
+        accented_index, plain_index = self.index(level, province_id)
+        index = plain_index if normalize_vietnamese(prefix) == prefix else accented_index
+        if query[-1].isspace():
+            # "ben " should complete "bến tre" but not "bentre"
+            prefix += " "
+
+        gazetteer = self.gazetteer
+        return [
+            Completion(level, unit_id, gazetteer.name(level, unit_id), gazetteer.province_of(level, unit_id), spelling)
+            for unit_id, spelling in index.complete(prefix, limit)
+        ]
+
+
+_autocompleter = None
+
+
+def get_autocompleter():
+    """The autocompleter of the active gazetteer"""
+    global _autocompleter
+    gazetteer = load_gazetteer()
+    autocompleter = _autocompleter
+    if autocompleter is None or autocompleter.gazetteer is not gazetteer:
+        autocompleter = _autocompleter = Autocompleter(gazetteer)
+        _complete.cache_clear()
+    return autocompleter
+
+
+@lru_cache(maxsize=4096)
+def _complete(autocompleter, query, level, province, limit):
+    return tuple(autocompleter.complete(query, level, province, limit))
+
+
+def complete(query, level="ward", province=None, limit=10):
+    """Ranked completions of a partly typed name, see `Autocompleter.complete`"""
+    return list(_complete(get_autocompleter(), query, level, province, limit))
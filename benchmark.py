@@ -0,0 +1,396 @@
+"""Throughput and accuracy benchmark for `parser.parse_address`.
+
+    python benchmark.py --size 2000                 # offline, stub NER
+    python benchmark.py --size 500 --ner transformers
+    python benchmark.py --corpus golden.jsonl --write-corpus
+    python benchmark.py --ner transformers --compare-segment-ner
+
+The corpus is generated from data/new_address.json and data/old_address.json
+with a fixed seed, so runs are comparable: every address comes with its
+expected province and ward (new format) or district (old format) and is
+written the way users write them, with abbreviations ("Q.1", "TP.HCM"),
+missing diacritics, dashes instead of commas and duplicated segments.
+
+The report gives addresses/second, p50/p95/p99 latency, per-field accuracy
+and the time spent in preprocessing, NER, province matching and ward/district
+matching. The default stub NER tags every comma segment as a location, so the
+numbers isolate the rule side of the parser and need no model download.
+
+`--compare-segment-ner` runs the corpus twice, with whole-string NER and
+with per-segment cached NER (`ner.SegmentCacheBackend`), and reports how
+often the two agree on entities and on the parse, next to both speeds.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+import unicodedata
+
+from data import NEW_ADDRESS_PATH, OLD_ADDRESS_PATH
+from instrumentation import STAGES, MetricsRecorder, recording
+from utils import normalize_vietnamese
+
+STREET_NAMES = (
+    "Lê Lợi", "Nguyễn Huệ", "Trần Hưng Đạo", "Hai Bà Trưng", "Lý Thường Kiệt",
+    "Nguyễn Trãi", "Điện Biên Phủ", "Cách Mạng Tháng Tám", "Phan Đình Phùng",
+    "Hùng Vương", "Quang Trung", "Lê Duẩn", "Võ Văn Tần", "Nguyễn Văn Cừ",
+)
+
+STREET_FORMATS = (
+    "{number} {street}",
+    "Số {number} {street}",
+    "Số {number}, Đường {street}",
+    "{number}/{alley} {street}",
+    "Ngõ {alley} {street}",
+    "Thôn {village}",
+    "Tổ {alley}, Ấp {village}",
+)
+
+VILLAGES = ("Đông", "Tây", "Nam", "Bắc", "Trung", "Hòa Bình", "Tân Lập", "Phú Mỹ")
+
+# Spellings users actually type, by the full prefix they stand for
+PREFIX_ABBREVIATIONS = {
+    "Thành phố": ("TP. ", "TP.", "TP ", "Tp. ", "T.P. "),
+    "Tỉnh": ("T. ", ""),
+    "Quận": ("Q.", "Q. ", "Q "),
+    "Huyện": ("H. ", "H."),
+    "Thị xã": ("TX. ", "TX "),
+    "Phường": ("P.", "P. ", "P "),
+    "Xã": ("X. ", "X "),
+    "Thị trấn": ("TT. ", "TT "),
+}
+
+PROVINCE_ABBREVIATIONS = {
+    "Thành phố Hồ Chí Minh": ("TP.HCM", "TPHCM", "HCM", "Sài Gòn"),
+    "Tỉnh Bà Rịa - Vũng Tàu": ("BR-VT", "BRVT"),
+    "Thành phố Hà Nội": ("HN", "Hà Nội"),
+}
+
+# Noise applied to each generated address, with its probability
+NOISE = (
+    ("abbreviate", 0.4),
+    ("strip_accents", 0.25),
+    ("lowercase", 0.2),
+    ("dashes", 0.1),
+    ("duplicate", 0.1),
+    ("country", 0.2),
+)
+
+KEY_PREFIX_REGEX = re.compile(
+    r"^(?:thanh pho|thi xa|thi tran|khu pho|dac khu|quan|huyen|phuong|xa|tinh|tp|tx|tt|q|h|p|x|t)(?:\s+|(?=\d))"
+)
+
+
+def _remove_diacritics(text):
+    text = text.replace("đ", "d").replace("Đ", "D")
+    return "".join(
+        c for c in unicodedata.normalize("NFD", text)
+        if unicodedata.category(c) != "Mn"
+    )
+
+
+def _abbreviate(name, rng):
+    abbreviations = PROVINCE_ABBREVIATIONS.get(name)
+    if abbreviations:
+        return rng.choice(abbreviations)
+
+    for prefix, short_forms in PREFIX_ABBREVIATIONS.items():
+        if name.startswith(prefix + " "):
+            return rng.choice(short_forms) + name[len(prefix) + 1:]
+    return name
+
+
+def _street(rng):
+    return rng.choice(STREET_FORMATS).format(
+        number=rng.randint(1, 400),
+        alley=rng.randint(1, 60),
+        street=rng.choice(STREET_NAMES),
+        village=rng.choice(VILLAGES),
+    )
+
+
+def _load_entries(path, level):
+    with open(path, "r", encoding="utf-8") as f:
+        return [(item["province"], item[level]) for item in json.load(f)]
+
+
+def generate_corpus(size, seed=0, new_address_path=NEW_ADDRESS_PATH, old_address_path=OLD_ADDRESS_PATH):
+    """`size` noisy addresses with their expected components, reproducible by `seed`"""
+    rng = random.Random(seed)
+    wards = _load_entries(new_address_path, "ward")
+    districts = _load_entries(old_address_path, "district")
+
+    corpus = []
+    for _ in range(size):
+        sample = {"province": None, "district": None, "ward": None}
+        if rng.random() < 0.6 or not districts:
+            province, ward = rng.choice(wards)
+            sample["province"], sample["ward"] = province, ward
+            units = [ward, province]
+        else:
+            province, district = rng.choice(districts)
+            sample["province"], sample["district"] = province, district
+            units = [district, province]
+
+        noise = {name for name, probability in NOISE if rng.random() < probability}
+        if "abbreviate" in noise:
+            units = [_abbreviate(unit, rng) for unit in units]
+
+        parts = [_street(rng)] + units
+        if "duplicate" in noise:
+            i = rng.randrange(len(parts))
+            parts.insert(i, parts[i])
+        if "country" in noise:
+            parts.append(rng.choice(("Việt Nam", "Vietnam", "VN")))
+
+        address = (" - " if "dashes" in noise else ", ").join(parts)
+        if "strip_accents" in noise:
+            address = _remove_diacritics(address)
+        if "lowercase" in noise:
+            address = address.lower()
+
+        sample["address"] = address
+        sample["noise"] = sorted(noise)
+        corpus.append(sample)
+
+    return corpus
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_corpus(corpus, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for sample in corpus:
+            f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+
+
+def match_key(name):
+    """Comparison key for an admin unit: unaccented, without its prefix"""
+    if isinstance(name, list):
+        name = name[0] if name else ""
+    if not name:
+        return ""
+
+    key = " ".join(re.findall(r"\w+", normalize_vietnamese(str(name))))
+    key = KEY_PREFIX_REGEX.sub("", key)
+    return re.sub(r"\b0+(\d)", r"\1", key)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _score(corpus, results):
+    fields = {"province": "ctryname", "district": "ctrysubdivname", "ward": "ctrysubsubdivname"}
+    correct = {field: 0 for field in fields}
+    total = {field: 0 for field in fields}
+    exact = 0
+    errors = []
+
+    for sample, result in zip(corpus, results):
+        result = result.to_dict()
+        all_correct = True
+        for field, result_field in fields.items():
+            if sample.get(field) is None:
+                continue
+            total[field] += 1
+            if match_key(result.get(result_field)) == match_key(sample[field]):
+                correct[field] += 1
+            else:
+                all_correct = False
+
+        if all_correct:
+            exact += 1
+        else:
+            errors.append({"address": sample["address"], "expected": sample, "parsed": result})
+
+    accuracy = {field: correct[field] / total[field] if total[field] else None for field in fields}
+    accuracy["address"] = exact / len(corpus) if corpus else None
+    return accuracy, errors
+
+
+def run_benchmark(corpus, warmup=20, cascade=False, keep_results=False):
+    import parser
+
+    if cascade:
+        # Built on the first address without commas otherwise
+        import scanner
+        scanner.get_scanner()
+
+    for sample in corpus[:warmup]:
+        parser.parse_address(sample["address"], cascade=cascade)
+
+    recorder = MetricsRecorder()
+    latencies = []
+    results = []
+    with recording(recorder):
+        start = time.perf_counter()
+        for sample in corpus:
+            t = time.perf_counter()
+            results.append(parser.parse_address(sample["address"], cascade=cascade))
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+
+    metrics = recorder.snapshot()
+    accuracy, errors = _score(corpus, results)
+    latencies.sort()
+    return {
+        "addresses": len(corpus),
+        "seconds": elapsed,
+        "addresses_per_second": len(corpus) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50) * 1000,
+            "p95": _percentile(latencies, 95) * 1000,
+            "p99": _percentile(latencies, 99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        "stages_seconds": {stage: metrics["stage_seconds"].get(stage, 0.0) for stage in STAGES},
+        "matches": metrics["matches"],
+        "counters": metrics["counters"],
+        "accuracy": accuracy,
+        "errors": errors,
+        **({"results": results} if keep_results else {}),
+    }
+
+
+def compare_segment_ner(corpus, backend, max_entries=50000, warmup=20, cascade=False):
+    """Whole-string NER against `SegmentCacheBackend` on the same corpus"""
+    import ner
+    import parser
+
+    segment_backend = ner.SegmentCacheBackend(backend, max_entries=max_entries)
+
+    ner.set_backend(backend)
+    whole = run_benchmark(corpus, warmup=warmup, cascade=cascade, keep_results=True)
+    ner.set_backend(segment_backend)
+    segmented = run_benchmark(corpus, warmup=warmup, cascade=cascade, keep_results=True)
+
+    texts = [parser._clean_address(sample["address"]) for sample in corpus]
+    same_entities = 0
+    for text, a, b in zip(texts, backend.predict(texts), segment_backend.predict(texts)):
+        words_a = [(e["entity"], e["word"]) for e in ner.group_and_clean_entities(a, text)]
+        words_b = [(e["entity"], e["word"]) for e in ner.group_and_clean_entities(b, text)]
+        same_entities += words_a == words_b
+
+    same_results = sum(
+        a.to_dict() == b.to_dict()
+        for a, b in zip(whole.pop("results"), segmented.pop("results"))
+    )
+    return {
+        "whole": whole,
+        "segmented": segmented,
+        "segment_cache": segment_backend.cache.stats(),
+        "entity_agreement": same_entities / len(corpus) if corpus else None,
+        "result_agreement": same_results / len(corpus) if corpus else None,
+    }
+
+
+def format_comparison(comparison):
+    lines = []
+    for name in ("whole", "segmented"):
+        report = comparison[name]
+        accuracy = report["accuracy"]["address"]
+        lines.append(
+            f"{name:<10} {report['addresses_per_second']:9.1f} addresses/s, "
+            f"p95 {report['latency_ms']['p95']:.3f} ms, "
+            f"address accuracy " + ("n/a" if accuracy is None else f"{accuracy:.1%}")
+        )
+
+    stats = comparison["segment_cache"]
+    lines += [
+        f"segment cache hit rate {stats['hit_rate']:.1%} ({stats['entries']} segments cached)",
+        f"same entities {comparison['entity_agreement']:.1%}, "
+        f"same parse {comparison['result_agreement']:.1%}",
+    ]
+    return "\n".join(lines)
+
+
+def format_report(report):
+    lines = [
+        f"{report['addresses']} addresses in {report['seconds']:.2f}s, "
+        f"{report['addresses_per_second']:.1f} addresses/s",
+        "latency ms: " + ", ".join(f"{k} {v:.3f}" for k, v in report["latency_ms"].items()),
+        "",
+        "stage            total s   share   mean ms",
+    ]
+    for stage, seconds in report["stages_seconds"].items():
+        share = seconds / report["seconds"] if report["seconds"] else 0.0
+        mean = seconds / report["addresses"] * 1000 if report["addresses"] else 0.0
+        lines.append(f"{stage:<15} {seconds:8.3f} {share:7.1%} {mean:9.3f}")
+
+    lines += ["", "matches"]
+    for name, n in sorted(report["matches"].items()):
+        lines.append(f"  {name:<22} {n:6d}")
+
+    for name, n in sorted(report["counters"].items()):
+        lines.append(f"  {name:<22} {n:6d}")
+
+    lines += ["", "accuracy"]
+    for field, value in report["accuracy"].items():
+        lines.append(f"  {field:<13} " + ("n/a" if value is None else f"{value:.1%}"))
+    return "\n".join(lines)
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Benchmark parse_address speed and accuracy")
+    arg_parser.add_argument("--size", type=int, default=1000, help="addresses to generate")
+    arg_parser.add_argument("--seed", type=int, default=0, help="corpus generator seed")
+    arg_parser.add_argument("--corpus", help="JSONL corpus to read, or to write with --write-corpus")
+    arg_parser.add_argument("--write-corpus", action="store_true", help="write the generated corpus to --corpus and exit")
+    arg_parser.add_argument("--ner", choices=("stub", "transformers", "quantized", "onnx"), default="stub", help="NER backend")
+    arg_parser.add_argument("--model", help="model name or local path for the NER backend")
+    arg_parser.add_argument("--threads", type=int, help="torch threads")
+    arg_parser.add_argument("--warmup", type=int, default=20, help="untimed addresses parsed first")
+    arg_parser.add_argument("--cascade", action="store_true", help="benchmark the rules-first cascade")
+    arg_parser.add_argument("--segment-cache", type=int, default=0, help="run NER per comma segment, caching this many segments")
+    arg_parser.add_argument("--compare-segment-ner", action="store_true", help="compare whole-string and per-segment cached NER")
+    arg_parser.add_argument("--json", help="also write the full report, with every miss, to this file")
+    return arg_parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    if args.corpus and not args.write_corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = generate_corpus(args.size, seed=args.seed)
+    if args.write_corpus:
+        if not args.corpus:
+            sys.exit("--write-corpus needs --corpus")
+        write_corpus(corpus, args.corpus)
+        print(f"Wrote {len(corpus)} addresses to {args.corpus}")
+        return
+
+    import ner
+    from cli import _make_backend
+
+    backend = _make_backend(args.ner, args.model, args.threads)
+    if args.compare_segment_ner:
+        report = compare_segment_ner(
+            corpus, backend, max_entries=args.segment_cache or 50000,
+            warmup=args.warmup, cascade=args.cascade,
+        )
+        print(format_comparison(report))
+    else:
+        ner.set_backend(backend)
+        if args.segment_cache:
+            ner.enable_segment_cache(max_entries=args.segment_cache)
+        report = run_benchmark(corpus, warmup=args.warmup, cascade=args.cascade)
+        print(format_report(report))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
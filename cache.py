@@ -0,0 +1,91 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def approx_size(obj):
+    """Rough deep size in bytes of the str/list/tuple/dict values we cache"""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__slots__"):
+        for name in obj.__slots__:
+            size += approx_size(getattr(obj, name, None))
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approx_size(key) + approx_size(value)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += approx_size(item)
+    return size
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts its least recently used entries.
+
+    Bounded by `max_entries`, by an approximate memory budget `max_bytes`,
+    or both. Hits, misses and evictions are counted for `stats()`.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = approx_size(key) + approx_size(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._data:
+                self.current_bytes -= self._sizes.pop(key)
+                del self._data[key]
+
+            self._data[key] = value
+            self._sizes[key] = size
+            self.current_bytes += size
+
+            while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries)
+                or (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+            ):
+                old_key, _ = self._data.popitem(last=False)
+                self.current_bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._data),
+            "bytes": self.current_bytes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,277 @@
+"""Parse a CSV or JSONL file of addresses across a process pool.
+
+    python cli.py addresses.csv -o parsed.csv --column address --workers 4
+
+Rows are streamed and written back in input order with a bounded number of
+chunks in flight. After every written chunk the number of input rows done is
+saved to a checkpoint file, so a crashed run continues with `--resume`.
+"""
+import argparse
+import csv
+import gc
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+RESULT_FIELDS = ("ctryname", "ctrysubdivname", "ctrysubsubdivname")
+
+BACKENDS = ("transformers", "quantized", "onnx", "stub")
+
+# Per worker process state, set up once by _init_worker
+_worker_options = {}
+
+
+def _make_backend(name, model=None, num_threads=None):
+    import ner
+
+    if name == "stub":
+        return ner.StubBackend()
+
+    backend_class = {
+        "transformers": ner.TransformersBackend,
+        "quantized": ner.QuantizedBackend,
+        "onnx": ner.OnnxBackend,
+    }[name]
+    return backend_class(model or ner.MODEL_NAME, num_threads=num_threads)
+
+
+def _init_worker(backend, model, num_threads, batch_size, cascade, segment_cache=0):
+    import ner
+    import parser  # noqa: F401 - builds the gazetteer once per worker
+
+    ner.set_backend(_make_backend(backend, model, num_threads))
+    if segment_cache:
+        ner.enable_segment_cache(max_entries=segment_cache)
+    if hasattr(ner.get_backend(), "load"):
+        ner.get_backend().load()
+
+    _worker_options["batch_size"] = batch_size
+    _worker_options["cascade"] = cascade
+
+
+def _parse_chunk(addresses):
+    import parser
+
+    return list(parser.parse_addresses(
+        addresses,
+        batch_size=_worker_options["batch_size"],
+        cascade=_worker_options["cascade"],
+    ))
+
+
+def _read_lines(path, counter):
+    # Decode line by line from a binary file so the byte position stays
+    # known for the progress estimate
+    with open(path, "rb") as f:
+        for i, line in enumerate(f):
+            counter[0] += len(line)
+            yield line.decode("utf-8-sig" if i == 0 else "utf-8")
+
+
+def _read_rows(path, fmt, counter):
+    lines = _read_lines(path, counter)
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.fieldnames, row
+    else:
+        for line in lines:
+            if line.strip():
+                row = json.loads(line)
+                yield None, row
+
+
+def _chunks(rows, chunk_size, skip):
+    chunk = []
+    for i, (fieldnames, row) in enumerate(rows):
+        if i < skip:
+            continue
+
+        chunk.append((fieldnames, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _flatten(value):
+    if isinstance(value, list):
+        return "; ".join(value)
+    return value
+
+
+class _Writer:
+    def __init__(self, path, fmt, resume_at=None):
+        self.fmt = fmt
+        self.append = resume_at is not None
+        if self.append:
+            # Drop anything written after the last checkpoint
+            with open(path, "r+b") as f:
+                f.truncate(resume_at)
+        self.file = open(path, "a" if self.append else "w", encoding="utf-8", newline="")
+        self.csv_writer = None
+
+    def write(self, fieldnames, row, result):
+        result = result.to_dict()
+        if self.fmt == "jsonl":
+            row = dict(row)
+            row["parsed"] = result
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            return
+
+        if self.csv_writer is None:
+            fields = list(fieldnames) + [f for f in RESULT_FIELDS if f not in fieldnames]
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction="ignore")
+            if not self.append:
+                self.csv_writer.writeheader()
+
+        row = dict(row)
+        for field in RESULT_FIELDS:
+            row[field] = _flatten(result.get(field, ""))
+        self.csv_writer.writerow(row)
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0, 0
+    return checkpoint["rows"], checkpoint["output_bytes"]
+
+
+def _save_checkpoint(path, rows, output_bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"rows": rows, "output_bytes": output_bytes}, f)
+    os.replace(tmp_path, path)
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def run(args):
+    fmt = args.format or ("jsonl" if args.input.endswith((".jsonl", ".ndjson")) else "csv")
+    checkpoint = args.checkpoint or args.output + ".checkpoint"
+    skip, output_bytes = _load_checkpoint(checkpoint) if args.resume else (0, 0)
+
+    total_bytes = os.path.getsize(args.input)
+    counter = [0]
+    rows = _read_rows(args.input, fmt, counter)
+    chunks = _chunks(rows, args.chunk_size, skip)
+    writer = _Writer(args.output, fmt, resume_at=output_bytes if skip else None)
+
+    init_args = (args.backend, args.model, args.threads, args.batch_size, args.cascade, args.segment_cache)
+    if args.workers > 0:
+        # Load the gazetteer before forking so workers share its pages, and
+        # keep the collector from writing to them afterwards
+        import parser  # noqa: F401
+        gc.freeze()
+
+        executor = ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=init_args)
+        submit = executor.submit
+    else:
+        executor = None
+        _init_worker(*init_args)
+
+        def submit(fn, *fn_args):
+            from concurrent.futures import Future
+
+            future = Future()
+            future.set_result(fn(*fn_args))
+            return future
+
+    start = time.monotonic()
+    start_bytes = None
+    last_report = start
+    done = skip
+    pending = deque()
+    max_pending = max(1, args.workers) * 2
+
+    def drain_one():
+        nonlocal done
+        chunk, future = pending.popleft()
+        for (fieldnames, row), result in zip(chunk, future.result()):
+            writer.write(fieldnames, row, result)
+        done += len(chunk)
+        _save_checkpoint(checkpoint, done, writer.flush())
+
+    try:
+        for chunk in chunks:
+            if start_bytes is None:
+                start_bytes = counter[0]
+
+            addresses = [row.get(args.column) or "" for _, row in chunk]
+            pending.append((chunk, submit(_parse_chunk, addresses)))
+            if len(pending) >= max_pending:
+                drain_one()
+
+            now = time.monotonic()
+            if now - last_report >= args.progress_interval:
+                last_report = now
+                elapsed = now - start
+                rate = (done - skip) / elapsed if elapsed else 0.0
+                byte_rate = (counter[0] - start_bytes) / elapsed if elapsed else 0.0
+                eta = (total_bytes - counter[0]) / byte_rate if byte_rate else 0.0
+                print(
+                    f"{done} rows, {rate:.1f} rows/s, ETA {_format_eta(eta)}",
+                    file=sys.stderr,
+                )
+
+        while pending:
+            drain_one()
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    elapsed = time.monotonic() - start
+    parsed = done - skip
+    rate = parsed / elapsed if elapsed else 0.0
+    print(
+        f"Parsed {parsed} rows ({done} total) in {elapsed:.1f}s, {rate:.1f} rows/s",
+        file=sys.stderr,
+    )
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Parse Vietnamese addresses in a CSV/JSONL file")
+    arg_parser.add_argument("input", help="input .csv or .jsonl file")
+    arg_parser.add_argument("-o", "--output", required=True, help="output file, same format as input")
+    arg_parser.add_argument("--format", choices=("csv", "jsonl"), help="input format, guessed from the extension by default")
+    arg_parser.add_argument("--column", default="address", help="column/key holding the address")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes, 0 to parse in-process")
+    arg_parser.add_argument("--chunk-size", type=int, default=256, help="rows sent to a worker at a time")
+    arg_parser.add_argument("--batch-size", type=int, default=32, help="NER batch size inside a worker")
+    arg_parser.add_argument("--backend", choices=BACKENDS, default="transformers", help="NER backend")
+    arg_parser.add_argument("--model", help="model name or local path for the NER backend")
+    arg_parser.add_argument("--threads", type=int, help="torch threads per worker")
+    arg_parser.add_argument("--cascade", action="store_true", help="skip NER for addresses the rule parse settles")
+    arg_parser.add_argument("--segment-cache", type=int, default=0, help="run NER per comma segment, caching this many segments per worker")
+    arg_parser.add_argument("--checkpoint", help="checkpoint file, defaults to OUTPUT.checkpoint")
+    arg_parser.add_argument("--resume", action="store_true", help="continue after the rows recorded in the checkpoint")
+    arg_parser.add_argument("--progress-interval", type=float, default=10.0, help="seconds between progress lines")
+    return arg_parser
+
+
+def main(argv=None):
+    run(build_arg_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
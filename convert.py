@@ -0,0 +1,177 @@
+"""Convert addresses from before the 2025 merger to the current units.
+
+`data/old_to_new.json` lists the current province, and ward when known,
+that an old province, district or ward became:
+
+    {"old_province": "Tỉnh Long An", "old_district": null, "old_ward": null,
+     "new_province": "Tỉnh Tây Ninh", "new_ward": null}
+
+A null old field stands for every unit below it, so a single row can move
+a whole province, and the most specific row matching an address wins.
+`ConversionIndex` resolves the rows to gazetteer IDs once, after which a
+lookup is a few dict probes.
+
+    for conversion in convert_addresses(addresses):
+        conversion.province, conversion.ward, conversion.level
+"""
+import logging
+from collections import namedtuple
+
+from data import OLD_TO_NEW_PATH, WARD_PREFIX_REGEX, load_old_to_new
+from parser import _active_gazetteer, _one_gazetteer, parse_addresses
+from utils import normalize_string, normalize_vietnamese
+
+logger = logging.getLogger(__name__)
+
+# `address` is the ParsedAddress converted. `level` is the most specific
+# level of the mapping row used ("ward", "district" or "province"),
+# "current" when the address already uses the current units and None when
+# nothing maps it; the other fields are then None too.
+Conversion = namedtuple("Conversion", "address province_id province ward_id ward level")
+
+
+def _ward_keys(name):
+    # Old wards aren't in the gazetteer, so they are matched by name, with
+    # and without their prefix
+    key = normalize_vietnamese(normalize_string(name))
+    stripped = WARD_PREFIX_REGEX.sub("", key)
+    return (key, stripped) if stripped and stripped != key else (key,)
+
+
+def _first(value):
+    if isinstance(value, tuple):
+        return value[0] if value else ""
+    return value
+
+
+class ConversionIndex:
+    """Old (province, district, ward) -> current (province, ward) IDs"""
+
+    __slots__ = ("gazetteer", "_table")
+
+    def __init__(self, rows, gazetteer=None):
+        gazetteer = gazetteer or _active_gazetteer()
+        self.gazetteer = gazetteer
+        self._table = {}
+
+        for row in rows:
+            province_id = gazetteer.province_id(normalize_string(row["old_province"]))
+            new_province_id = gazetteer.province_id(normalize_string(row["new_province"]))
+            if province_id is None or new_province_id is None:
+                logger.warning("Skipping conversion row with unknown province: %s", row)
+                continue
+
+            district_id = None
+            if row.get("old_district"):
+                district_id = self._unit_id("district", row["old_district"], province_id)
+                if district_id is None:
+                    logger.warning("Skipping conversion row with unknown district: %s", row)
+                    continue
+
+            new_ward_id = None
+            if row.get("new_ward"):
+                new_ward_id = self._unit_id("ward", row["new_ward"], new_province_id)
+                if new_ward_id is None:
+                    logger.warning("Skipping conversion row with unknown ward: %s", row)
+                    continue
+
+            if row.get("old_ward"):
+                level = "ward"
+                keys = [(province_id, district_id, key) for key in _ward_keys(row["old_ward"])]
+            else:
+                level = "district" if district_id is not None else "province"
+                keys = [(province_id, district_id, None)]
+            for key in keys:
+                self._table[key] = (new_province_id, new_ward_id, level)
+
+    def _unit_id(self, level, name, province_id):
+        for unit_id in self.gazetteer.ids(level, normalize_string(name)):
+            if self.gazetteer.province_of(level, unit_id) == province_id:
+                return unit_id
+        return None
+
+    def __len__(self):
+        return len(self._table)
+
+    def lookup(self, province_id, district_id=None, ward=None):
+        """(province ID, ward ID or None, level) an old unit became, or None"""
+        table = self._table
+        if ward:
+            for key in _ward_keys(ward):
+                hit = table.get((province_id, district_id, key))
+                if hit is None and district_id is not None:
+                    hit = table.get((province_id, None, key))
+                if hit is not None:
+                    return hit
+        if district_id is not None:
+            hit = table.get((province_id, district_id, None))
+            if hit is not None:
+                return hit
+        return table.get((province_id, None, None))
+
+    def convert(self, result):
+        """The `Conversion` of a `ParsedAddress` parsed with this gazetteer"""
+        gazetteer = self.gazetteer
+        province_id = result.province_id
+        if province_id is None:
+            return Conversion(result, None, None, None, None, None)
+
+        # Current addresses name a current ward and no district; an address
+        # whose district wasn't recognised is looked up like any other
+        if result.district_id is None and result.ward_id is not None:
+            return Conversion(result, province_id, result.province, result.ward_id, result.ward, "current")
+
+        hit = self.lookup(province_id, result.district_id, _first(result.ctrysubsubdivname))
+        if hit is None:
+            return Conversion(result, None, None, None, None, None)
+
+        new_province_id, new_ward_id, level = hit
+        return Conversion(
+            result,
+            new_province_id,
+            gazetteer.name("province", new_province_id),
+            new_ward_id,
+            gazetteer.name("ward", new_ward_id) if new_ward_id is not None else None,
+            level,
+        )
+
+
+_index = None
+
+
+def get_index(gazetteer=None):
+    """The conversion index of `gazetteer`, by default the active one"""
+    global _index
+    gazetteer = gazetteer or _active_gazetteer()
+    index = _index
+    if index is None or index.gazetteer is not gazetteer:
+        index = ConversionIndex(load_old_to_new(OLD_TO_NEW_PATH), gazetteer)
+        _index = index
+    return index
+
+
+@_one_gazetteer
+def _convert_batch(addresses, batch_size, cascade):
+    index = get_index()
+    return [index.convert(result) for result in parse_addresses(addresses, batch_size=batch_size, cascade=cascade)]
+
+
+def convert_address(address: str, cascade=False) -> Conversion:
+    return _convert_batch([address], 1, cascade)[0]
+
+
+def convert_addresses(addresses, batch_size=32, cascade=False):
+    """Parse and convert an iterable of addresses, yielding `Conversion`s.
+
+    Addresses are parsed like `parser.parse_addresses` (same batching and
+    `cascade`), lazily and in input order.
+    """
+    batch = []
+    for address in addresses:
+        batch.append(address)
+        if len(batch) >= batch_size:
+            yield from _convert_batch(batch, batch_size, cascade)
+            batch = []
+
+    if batch:
+        yield from _convert_batch(batch, batch_size, cascade)
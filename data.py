@@ -1,10 +1,18 @@
+import logging
 import os
+import re
 import json
 from utils import normalize_string
 
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+NEW_ADDRESS_PATH = os.path.join(DATA_DIR, "new_address.json")
+OLD_ADDRESS_PATH = os.path.join(DATA_DIR, "old_address.json")
+OLD_TO_NEW_PATH = os.path.join(DATA_DIR, "old_to_new.json")
+
 # Read from new_address.json
-def load_new_address():
-    json_file_path = os.path.join("data", "new_address.json")
+def load_new_address(json_file_path=NEW_ADDRESS_PATH):
     try:
         with open(json_file_path, "r", encoding="utf-8") as f:
             address_data = json.load(f)
@@ -21,15 +29,14 @@ def load_new_address():
 
         return address_dict
     except FileNotFoundError:
-        print(f"File {json_file_path} not found")
+        logger.error("File %s not found", json_file_path)
         return {}
     except json.JSONDecodeError:
-        print(f"Invalid JSON in {json_file_path}")
+        logger.error("Invalid JSON in %s", json_file_path)
         return {}
 
 
-def load_old_address():
-    json_file_path = os.path.join("data", "old_address.json")
+def load_old_address(json_file_path=OLD_ADDRESS_PATH):
     try:
         with open(json_file_path, "r", encoding="utf-8") as f:
             address_data = json.load(f)
@@ -46,13 +53,26 @@ def load_old_address():
 
         return address_dict
     except FileNotFoundError:
-        print(f"File {json_file_path} not found")
+        logger.error("File %s not found", json_file_path)
         return {}
     except json.JSONDecodeError:
-        print(f"Invalid JSON in {json_file_path}")
+        logger.error("Invalid JSON in %s", json_file_path)
         return {}
 
 
+# Read from old_to_new.json, see convert.py
+def load_old_to_new(json_file_path=OLD_TO_NEW_PATH):
+    try:
+        with open(json_file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.error("File %s not found", json_file_path)
+        return []
+    except json.JSONDecodeError:
+        logger.error("Invalid JSON in %s", json_file_path)
+        return []
+
+
 SPECIAL_PROVINCE_MAP = {
     ("br vt", "br-vt", "brvt", "ba ria vung tau"): "Bà Rịa - Vũng Tàu",
     (
@@ -85,13 +105,98 @@ DASH_CASES = [
     ("lang biang", "đà lạt"),
 ]
 
-NEW_ADDRESS = load_new_address()
-OLD_ADDRESS = load_old_address()
+# Leading words that tell the level of an address segment, as (spelling,
+# levels, expansion) rows compiled by prefixes.py. Spellings are lowercase
+# words; dots and a number glued to the last word ("q.1", "p5") are
+# allowed when matching. An abbreviation is rewritten to its expansion, a
+# None expansion keeps the segment as written. A number at the start of a
+# segment also marks a street. Add rows here for spellings the parser
+# should know.
+PREFIX_RULES = [
+    ("thành phố", ("province", "district"), None),
+    ("thanh pho", ("province", "district"), None),
+    ("tp", ("province", "district"), "thành phố"),
+    ("t p", ("province", "district"), "thành phố"),
+    ("tỉnh", ("province",), None),
+    ("tinh", ("province",), None),
+    ("t", ("province",), "tỉnh"),
+    ("quận", ("district",), None),
+    ("quan", ("district",), None),
+    ("q", ("district",), "quận"),
+    ("huyện", ("district",), None),
+    ("huyen", ("district",), None),
+    ("h", ("district",), "huyện"),
+    ("thị xã", ("district",), None),
+    ("thi xa", ("district",), None),
+    ("tx", ("district",), "thị xã"),
+    ("phường", ("ward",), None),
+    ("phuong", ("ward",), None),
+    ("p", ("ward",), "phường"),
+    ("xã", ("ward",), None),
+    ("xa", ("ward",), None),
+    ("x", ("ward",), "xã"),
+    ("đặc khu", ("ward",), None),
+    ("dac khu", ("ward",), None),
+    ("đk", ("ward",), "đặc khu"),
+    ("dk", ("ward",), "đặc khu"),
+    ("thị trấn", ("ward",), None),
+    ("thi tran", ("ward",), None),
+    ("tt", ("ward",), "thị trấn"),
+    ("khu phố", ("ward",), None),
+    ("khu pho", ("ward",), None),
+    ("kp", ("ward",), "khu phố"),
+    ("số", ("street",), None),
+    ("đường", ("street",), None),
+    ("duong", ("street",), None),
+    ("phố", ("street",), None),
+    ("pho", ("street",), None),
+    ("tổ", ("street",), None),
+    ("to", ("street",), None),
+    ("lô", ("street",), None),
+    ("lo", ("street",), None),
+    ("thôn", ("street",), None),
+    ("thon", ("street",), None),
+    ("ngõ", ("street",), None),
+    ("ngo", ("street",), None),
+    ("ngách", ("street",), None),
+    ("ngach", ("street",), None),
+    ("hẻm", ("street",), None),
+    ("hem", ("street",), None),
+    ("toà nhà", ("street",), None),
+    ("tòa nhà", ("street",), None),
+    ("toa nha", ("street",), None),
+]
 
-VN_PROVINCES_SET = set()
+# Whole words of an address expanded before it is parsed
+ADDRESS_ABBREVIATIONS = {
+    "tphcm": "Thành phố Hồ Chí Minh",
+    "hcm": "Hồ Chí Minh",
+}
 
-for province in OLD_ADDRESS.keys():
-    VN_PROVINCES_SET.add(province)
- 
-for province in NEW_ADDRESS.keys():
-    VN_PROVINCES_SET.add(province)
\ No newline at end of file
+# Strip the admin prefix of a gazetteer name; the parser classifies address
+# segments with PREFIX_RULES instead
+DISTRICT_PREFIX_REGEX = re.compile(
+    r"^(?:q\.?\s?\d*|quan|quận|h\.?\s?|huyen|huyện|tp\.?|t\.p\.?|thanh pho|thành phố|thi xa|thị xã|tx\.?\s?)\b\.?,?\s*",
+    flags=re.IGNORECASE,
+)
+
+WARD_PREFIX_REGEX = re.compile(
+    r"^(?:p\.?\s?\d*|phuong|phường|xa|xã|x\.?|đặc khu|dac khu|dk\.?|thi tran|thị trấn|tt\.?|khu pho|khu phố|kp\.?)\b\.?,?\s*",
+    flags=re.IGNORECASE,
+)
+
+PROVINCE_PREFIX_REGEX = re.compile(
+    r"^(?:tp\.?\s?|t\.?\s?|thanh pho|thành phố|tinh|tỉnh)\b\.?,?\s*",
+    flags=re.IGNORECASE,
+)
+
+
+def __getattr__(name):
+    # NEW_ADDRESS, OLD_ADDRESS and VN_PROVINCES_SET are rebuilt from the
+    # compiled gazetteer on access, so importing this module no longer parses
+    # the JSON files
+    if name in ("NEW_ADDRESS", "OLD_ADDRESS", "VN_PROVINCES_SET"):
+        from gazetteer import legacy_table
+
+        return legacy_table(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
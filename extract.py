@@ -0,0 +1,249 @@
+"""Find and parse the addresses mentioned in long free-form text.
+
+`parse_address` expects a string that is an address. Delivery notes and
+chat transcripts are mostly something else, and too long for the model in
+one piece, so `extract_addresses` reads them as a stream of overlapping
+word windows:
+
+    with open("notes.txt", encoding="utf-8") as f:
+        for found in extract_addresses(f):
+            print(found.start, found.end, found.address.province)
+
+Each window goes through the NER backend, but only the tags of its middle
+part are kept; the overlap with the neighbouring windows gives the model
+context on both sides of every word. The kept tags form one stream, so an
+entity cut by a window edge comes out whole. LOCATION entities separated
+by nothing but punctuation (", ", " - ") make up one address, which is
+parsed like the NER output of `parse_address`.
+
+Only the current batch of windows and the text of an address still being
+read are held in memory, whatever the length of the input.
+"""
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import islice
+
+from instrumentation import timed
+from ner import get_backend
+from parser import _make_result, _one_gazetteer, _parse_entities
+
+# `start` and `end` are character offsets in the input, `text` the words
+# of the address joined by single spaces, `address` its ParsedAddress
+ExtractedAddress = namedtuple("ExtractedAddress", "start end text address")
+
+_WORD_REGEX = re.compile(r"\S+")
+
+# What may separate the entities of one address
+_GAP_REGEX = re.compile(r"[\s,;./\-–]*")
+
+
+def _words(chunks):
+    # (offset, word) of the whitespace-separated words of the concatenated
+    # chunks; a word running to the end of a chunk may continue in the next
+    offset = 0
+    pending = ""
+    for chunk in chunks:
+        text = pending + chunk
+        pending = ""
+        for m in _WORD_REGEX.finditer(text):
+            if m.end() == len(text):
+                pending = m.group()
+                offset += m.start()
+                break
+            yield offset + m.start(), m.group()
+        else:
+            offset += len(text)
+    if pending:
+        yield offset, pending
+
+
+def _windows(chunks, window_words, overlap_words):
+    # (words, own_from, own_to): `window_words` words overlapping the previous
+    # window by `overlap_words`, and the range of them whose tags are kept.
+    # The kept ranges of consecutive windows follow each other exactly.
+    stride = window_words - overlap_words
+    half = overlap_words // 2
+    stream = _words(chunks)
+    words = list(islice(stream, window_words))
+    own_from = 0
+    while words:
+        more = list(islice(stream, stride))
+        if not more:
+            yield words, own_from, len(words)
+            return
+        yield words, own_from, stride + half
+        words = words[stride:] + more
+        own_from = half
+
+
+class _Entity:
+    __slots__ = ("label", "start", "end", "offset", "end_offset", "words")
+
+    def __init__(self, label, start, end, offset, end_offset, word):
+        self.label = label
+        self.start = start
+        self.end = end
+        self.offset = offset
+        self.end_offset = end_offset
+        self.words = [word]
+
+
+class AddressExtractor:
+    """Turns the tags of consecutive windows into addresses.
+
+    Positions are kept in the text the windows are made of, the input words
+    joined by single spaces, and mapped back to input offsets per word.
+    """
+
+    def __init__(self, max_gap=3):
+        self.max_gap = max_gap
+        self.text = ""  # the joined text from `text_start` on
+        self.text_start = 0
+        self.window_start = 0
+        self.entity = None
+        self.span = []
+
+    def feed(self, words, own_from, own_to, entities):
+        """Take the raw tags of one window, returning the addresses it completed"""
+        window_text = " ".join(word for _, word in words)
+        positions = []
+        position = 0
+        for _, word in words:
+            positions.append(position)
+            position += len(word) + 1
+
+        own_start = positions[own_from]
+        own_end = positions[own_to] if own_to < len(words) else len(window_text) + 1
+        # With the space that separates it from the next window's part
+        self.text += (window_text + " ")[own_start:own_end]
+
+        found = []
+        for ent in entities:
+            if not own_start <= ent["start"] < own_end:
+                continue
+            start = self.window_start + ent["start"]
+            end = self.window_start + ent["end"]
+            i = bisect_right(positions, ent["start"]) - 1
+            offset = words[i][0] + ent["start"] - positions[i]
+            i = bisect_right(positions, ent["end"] - 1) - 1
+            end_offset = words[i][0] + ent["end"] - positions[i]
+            word = window_text[ent["start"]:ent["end"]]
+
+            tag = ent["entity"]
+            entity = self.entity
+            if tag.startswith("I-") and entity is not None and start <= entity.end + 1:
+                # Subword pieces follow each other, words are one space apart
+                if start > entity.end:
+                    entity.words.append(word)
+                else:
+                    entity.words[-1] += word
+                entity.end = end
+                entity.end_offset = end_offset
+            else:
+                found.extend(self._close_entity())
+                if tag.startswith(("B-", "I-")):
+                    self.entity = _Entity(tag[2:], start, end, offset, end_offset, word)
+
+        # Nothing past the kept part can extend what ended well before it
+        covered = self.window_start + own_end
+        if self.entity is not None and self.entity.end + 1 < covered:
+            found.extend(self._close_entity())
+        if self.span and self.entity is None and self.span[-1].end + self.max_gap < covered:
+            found.extend(self._close_span())
+        return found
+
+    def advance(self, words, stride):
+        """Move the window start to the word `stride` of the window just fed"""
+        self.window_start += sum(len(word) + 1 for _, word in words[:stride])
+        self._trim()
+
+    def finish(self):
+        """The addresses still open at the end of the input"""
+        found = self._close_entity()
+        found.extend(self._close_span())
+        return found
+
+    def _trim(self):
+        # Only the text of the address being read is needed
+        if self.span:
+            keep = self.span[0].start
+        elif self.entity is not None:
+            keep = self.entity.start
+        else:
+            keep = self.text_start + len(self.text)
+        if keep > self.text_start:
+            self.text = self.text[keep - self.text_start:]
+            self.text_start = keep
+
+    def _close_entity(self):
+        entity = self.entity
+        self.entity = None
+        if entity is None or entity.label != "LOCATION":
+            return []
+
+        found = []
+        if self.span:
+            gap = self.text[self.span[-1].end - self.text_start:entity.start - self.text_start]
+            if len(gap) > self.max_gap or not _GAP_REGEX.fullmatch(gap):
+                found = self._close_span()
+        self.span.append(entity)
+        return found
+
+    def _close_span(self):
+        span = self.span
+        self.span = []
+        if not span:
+            return []
+
+        text = self.text[span[0].start - self.text_start:span[-1].end - self.text_start]
+        address = _parse_span(text, [" ".join(entity.words) for entity in span])
+        if address is None:
+            return []
+        return [ExtractedAddress(span[0].offset, span[-1].end_offset, text, address)]
+
+
+@_one_gazetteer
+def _parse_span(text, words):
+    parsed = _parse_entities(text, [{"entity": "LOCATION", "word": word} for word in words])
+    result = _make_result(text, parsed)
+    if result.ids == (None, None, None):
+        # A place name that isn't a Vietnamese address
+        return None
+    return result
+
+
+def extract_addresses(text, window_words=128, overlap_words=32, batch_size=8, max_gap=3):
+    """Yield the addresses found in `text` as `ExtractedAddress`es, in order.
+
+    `text` is a string or an iterable of strings read one at a time, such
+    as an open file. Windows of `window_words` words, overlapping by
+    `overlap_words`, are sent to the NER backend `batch_size` at a time;
+    keep windows well under the model's maximum sequence length, which
+    counts subword tokens rather than words. Entities more than `max_gap`
+    characters apart are separate addresses.
+    """
+    if not 0 <= overlap_words < window_words:
+        raise ValueError("overlap_words must be at least 0 and less than window_words")
+
+    chunks = (text,) if isinstance(text, str) else text
+    stride = window_words - overlap_words
+    windows = _windows(chunks, window_words, overlap_words)
+    extractor = AddressExtractor(max_gap=max_gap)
+    backend = get_backend()
+
+    while True:
+        batch = list(islice(windows, batch_size))
+        if not batch:
+            break
+
+        with timed("ner"):
+            batch_entities = backend.predict(
+                [" ".join(word for _, word in words) for words, _, _ in batch],
+                batch_size=batch_size,
+            )
+        for (words, own_from, own_to), entities in zip(batch, batch_entities):
+            yield from extractor.feed(words, own_from, own_to, entities)
+            extractor.advance(words, stride)
+
+    yield from extractor.finish()
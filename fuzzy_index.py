@@ -0,0 +1,186 @@
+import sys
+from bisect import insort
+from collections import Counter
+from functools import lru_cache
+
+from fuzzywuzzy import fuzz, utils as fuzz_utils
+
+NGRAM_SIZE = 2
+
+
+def _ngram_counts(text, n=NGRAM_SIZE):
+    counts = {}
+    for i in range(len(text) - n + 1):
+        gram = text[i : i + n]
+        counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+@lru_cache(maxsize=None)
+def _score_bound(shorter_len, common_grams, n=NGRAM_SIZE):
+    # Every indel between the shorter string and its best window in the longer
+    # one destroys at most `n` shared n-grams, and the window is never longer
+    # than the shorter string, so partial_ratio <= 1 - indels / (2 * shorter).
+    if shorter_len == 0:
+        return 100
+
+    missing = shorter_len - n + 1 - common_grams
+    min_indels = max(0, -(-missing // n))
+    ratio = 1 - min_indels / (2 * shorter_len)
+    if ratio > 0.995:
+        return 100
+    return fuzz_utils.intr(100 * ratio)
+
+
+@lru_cache(maxsize=None)
+def _min_common_grams(shorter_len, score_cutoff):
+    # Smallest n-gram overlap whose score bound still reaches the cutoff
+    for common_grams in range(shorter_len + 1):
+        if _score_bound(shorter_len, common_grams) >= score_cutoff:
+            return common_grams
+    return None
+
+
+class FuzzyIndex:
+    """Character n-gram index over a fixed list of choices.
+
+    `extract_one` returns exactly what
+    `process.extractOne(query, choices, scorer=fuzz.partial_ratio, score_cutoff=...)`
+    would, but only scores the candidates whose n-gram overlap leaves them a
+    chance of reaching the cutoff and beating the current best.
+
+    The index is read-only once built: its tables are tuples of interned
+    strings, so the many per-province indexes of the gazetteer share their
+    name and n-gram objects.
+    """
+
+    __slots__ = ("choices", "processed", "lengths", "by_length", "postings", "_choice_set")
+
+    def __init__(self, choices):
+        choice_list = []
+        processed_list = []
+        by_length = {}
+        # gram * k -> ids of the choices containing `gram` at least k times,
+        # so summing the lists for k <= query count gives the multiset overlap.
+        # Repeating a gram can't collide with another gram of the same size.
+        postings = {}
+
+        self._choice_set = set()
+        for choice in choices:
+            if choice in self._choice_set:
+                continue
+            choice = sys.intern(choice)
+            self._choice_set.add(choice)
+
+            idx = len(choice_list)
+            processed = fuzz_utils.full_process(choice)
+            processed = choice if processed == choice else sys.intern(processed)
+            choice_list.append(choice)
+            processed_list.append(processed)
+            by_length.setdefault(len(processed), []).append(idx)
+
+            for gram, count in _ngram_counts(processed).items():
+                for k in range(1, count + 1):
+                    postings.setdefault(sys.intern(gram * k), []).append(idx)
+
+        self.choices = tuple(choice_list)
+        self.processed = tuple(processed_list)
+        self.lengths = tuple(len(processed) for processed in processed_list)
+        self.by_length = {length: tuple(ids) for length, ids in by_length.items()}
+        self.postings = {key: tuple(ids) for key, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.choices)
+
+    def __iter__(self):
+        return iter(self.choices)
+
+    def __contains__(self, choice):
+        return choice in self._choice_set
+
+    def _shortlist(self, processed_query, score_cutoff):
+        query_len = len(processed_query)
+
+        common = Counter()
+        for gram, query_count in _ngram_counts(processed_query).items():
+            for k in range(1, query_count + 1):
+                ids = self.postings.get(gram * k)
+                if ids is None:
+                    break
+                common.update(ids)
+
+        shortlist = []
+        needed = {}
+        for length, indices in self.by_length.items():
+            shorter_len = min(query_len, length)
+            needed[length] = _min_common_grams(shorter_len, score_cutoff)
+            if needed[length] == 0:
+                # Even a candidate sharing no n-gram may reach the cutoff
+                for idx in indices:
+                    if idx not in common:
+                        shortlist.append((-_score_bound(shorter_len, 0), idx))
+
+        lengths = self.lengths
+        for idx, common_grams in common.items():
+            need = needed[lengths[idx]]
+            if need is not None and common_grams >= need:
+                bound = _score_bound(min(query_len, lengths[idx]), common_grams)
+                shortlist.append((-bound, idx))
+
+        shortlist.sort()
+        return shortlist
+
+    def extract_one(self, query, score_cutoff=0):
+        processed_query = fuzz_utils.full_process(query)
+
+        best_score = -1
+        best_idx = None
+        for neg_bound, idx in self._shortlist(processed_query, score_cutoff):
+            bound = -neg_bound
+            if bound < best_score:
+                break
+            if bound == best_score and idx > best_idx:
+                # The rest have a lower bound or a higher index
+                break
+
+            score = fuzz.partial_ratio(processed_query, self.processed[idx])
+            if score < score_cutoff:
+                continue
+            if score > best_score or (score == best_score and idx < best_idx):
+                best_score = score
+                best_idx = idx
+
+        if best_idx is None:
+            return None
+        return self.choices[best_idx], best_score
+
+    def extract_top(self, query, limit=5, score_cutoff=0):
+        """The `limit` best (choice, score) pairs, best first.
+
+        Same order as `process.extractBests` with `fuzz.partial_ratio`
+        (ties keep choice order). Candidates are scored in decreasing order
+        of their score bound, and the search stops as soon as the next bound
+        can't displace the current k-th best.
+        """
+        if limit <= 0:
+            return []
+        processed_query = fuzz_utils.full_process(query)
+
+        # (-score, idx) of the best candidates so far, sorted
+        best = []
+        for neg_bound, idx in self._shortlist(processed_query, score_cutoff):
+            if len(best) >= limit and (neg_bound, idx) > best[-1]:
+                break
+
+            score = fuzz.partial_ratio(processed_query, self.processed[idx])
+            if score < score_cutoff:
+                continue
+
+            key = (-score, idx)
+            if len(best) < limit:
+                insort(best, key)
+            elif key < best[-1]:
+                best.pop()
+                insort(best, key)
+
+        return [(self.choices[idx], -neg_score) for neg_score, idx in best]
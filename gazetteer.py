@@ -0,0 +1,384 @@
+"""The administrative units of the address data, with a compiled snapshot.
+
+`Gazetteer` holds every province, district and ward under an integer ID,
+with its names and the fuzzy indexes the parser matches against. Building it
+means parsing the JSON files and normalizing every name, which dominates
+import time. `python gazetteer.py` compiles them once into
+`data/gazetteer.snapshot`, a single pickle that later processes load instead.
+The snapshot records the format version and a hash of the JSON files, of the
+data.py tables and of the code the names go through, and is ignored (the
+tables are rebuilt) when either no longer matches.
+
+That hash is also the gazetteer's `version`. A long-running process can
+pick up new data files without restarting through `parser.reload_gazetteer`,
+which builds a new gazetteer and swaps it in with `set_gazetteer`.
+"""
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from array import array
+
+from data import (
+    DATA_DIR,
+    NEW_ADDRESS_PATH,
+    OLD_ADDRESS_PATH,
+    SPECIAL_PROVINCE_MAP_FULL,
+    DISTRICT_PREFIX_REGEX,
+    WARD_PREFIX_REGEX,
+    PROVINCE_PREFIX_REGEX,
+    load_new_address,
+    load_old_address,
+)
+import fuzzy_index
+import utils
+from fuzzy_index import FuzzyIndex
+from utils import normalize_vietnamese
+
+SNAPSHOT_VERSION = 5
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "gazetteer.snapshot")
+SOURCE_PATHS = (NEW_ADDRESS_PATH, OLD_ADDRESS_PATH)
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+# The code that normalizes and indexes the names, whose output the snapshot
+# holds as much as the data
+CODE_PATHS = (utils.__file__, fuzzy_index.__file__, os.path.abspath(__file__))
+
+
+def _derived_tables():
+    # The data.py tables the gazetteer bakes in besides the JSON files
+    tables = [repr(sorted(SPECIAL_PROVINCE_MAP_FULL.items()))]
+    for regex in (PROVINCE_PREFIX_REGEX, DISTRICT_PREFIX_REGEX, WARD_PREFIX_REGEX):
+        tables.append(f"{regex.pattern}\0{regex.flags}")
+    return "\0".join(tables).encode("utf-8")
+
+
+def source_fingerprint(paths=SOURCE_PATHS):
+    """Hash of the data files `paths` and of the tables and code applied to them"""
+    digest = hashlib.sha1()
+    for path in tuple(paths) + CODE_PATHS:
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            digest.update(b"\0")
+    digest.update(_derived_tables())
+    return digest.hexdigest()
+
+
+LEVELS = ("province", "district", "ward")
+
+LEVEL_PREFIX_REGEX = {
+    "province": PROVINCE_PREFIX_REGEX,
+    "district": DISTRICT_PREFIX_REGEX,
+    "ward": WARD_PREFIX_REGEX,
+}
+
+
+def _unit_keys(name, prefix_regex):
+    # Every spelling that identifies a unit exactly: accented, unaccented,
+    # and both without the admin prefix
+    keys = []
+    for key in (name, normalize_vietnamese(name)):
+        for key in (key, prefix_regex.sub("", key)):
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+class AdminUnit:
+    """A province, district or ward of the gazetteer, see `Gazetteer.unit`"""
+
+    __slots__ = ("level", "id", "name", "normalized", "province_id")
+
+    def __init__(self, level, id, name, normalized, province_id):
+        self.level = level
+        self.id = id
+        self.name = name
+        self.normalized = normalized
+        self.province_id = province_id
+
+    def __repr__(self):
+        return f"AdminUnit({self.level!r}, {self.id}, {self.name!r}, province_id={self.province_id})"
+
+    def __eq__(self, other):
+        return isinstance(other, AdminUnit) and (self.level, self.id) == (other.level, other.id)
+
+    def __hash__(self):
+        return hash((self.level, self.id))
+
+
+class Gazetteer:
+    """Read-only administrative units with integer IDs.
+
+    Provinces are numbered in sorted name order over both data sets.
+    Districts (old address data) and wards (new address data) are numbered
+    grouped by province, in data order, so the children of a province are a
+    contiguous ID range and their parent pointers fit in an array. Names are
+    interned and shared with the fuzzy indexes, and records (`AdminUnit`)
+    are only created on request.
+
+    The fuzzy indexes hold one matching key per unit, its unaccented name
+    (`normalized`): `province_index` and `province_id_index` over the
+    provinces and `ward_shards` / `district_shards` over the units of each
+    province ID. `ids` maps a key back to the units, and so to their
+    accented names; names differing only in accents share a key.
+
+    `version` identifies the data the gazetteer was built from (see
+    `source_fingerprint`), None when built from in-memory rows.
+    """
+
+    __slots__ = (
+        "version",
+        "names",
+        "normalized",
+        "parents",
+        "offsets",
+        "_keys",
+        "special_province_index",
+        "province_index",
+        "province_id_index",
+        "ward_shards",
+        "district_shards",
+    )
+
+    def __init__(self, provinces, districts, wards, province_lookup=None, version=None):
+        """`provinces` are names, `districts` and `wards` (province, name) rows"""
+        self.version = version
+        province_names = tuple(sys.intern(name) for name in sorted(set(provinces)))
+        province_ids = {name: i for i, name in enumerate(province_names)}
+
+        self.names = {"province": province_names}
+        self.normalized = {"province": tuple(sys.intern(normalize_vietnamese(name)) for name in province_names)}
+        self.parents = {}
+        self.offsets = {}
+        for level, rows in (("district", districts), ("ward", wards)):
+            children = [[] for _ in province_names]
+            for province, name in rows:
+                siblings = children[province_ids[province]]
+                if name not in siblings:
+                    siblings.append(name)
+
+            names = []
+            parents = array("H")
+            offsets = array("I", [0])
+            for province_id, siblings in enumerate(children):
+                names.extend(sys.intern(name) for name in siblings)
+                parents.extend([province_id] * len(siblings))
+                offsets.append(len(names))
+
+            self.names[level] = tuple(names)
+            self.normalized[level] = tuple(sys.intern(normalize_vietnamese(name)) for name in names)
+            self.parents[level] = parents
+            self.offsets[level] = offsets
+
+        # Exact spelling -> unit ID, or a tuple of IDs for names shared
+        # between units (there is a "phường 1" in many provinces)
+        self._keys = {}
+        for level in LEVELS:
+            keys = {}
+            for unit_id, name in enumerate(self.names[level]):
+                for key in _unit_keys(name, LEVEL_PREFIX_REGEX[level]):
+                    key = sys.intern(key)
+                    ids = keys.get(key)
+                    if ids is None:
+                        keys[key] = unit_id
+                    elif isinstance(ids, int):
+                        if ids != unit_id:
+                            keys[key] = (ids, unit_id)
+                    elif unit_id not in ids:
+                        keys[key] = ids + (unit_id,)
+            self._keys[level] = keys
+
+        if province_lookup is None:
+            province_lookup = set(province_names) | set(self.normalized["province"])
+        normalized_provinces = set(self.normalized["province"])
+        self.special_province_index = FuzzyIndex(SPECIAL_PROVINCE_MAP_FULL.keys())
+        # Sorted, so that ties between equal matches go to the first name
+        # whatever the hash seed that ordered `province_lookup`
+        self.province_index = FuzzyIndex(sorted(key for key in province_lookup if key in normalized_provinces))
+        self.province_id_index = FuzzyIndex(self.normalized["province"])
+        self.ward_shards = self._shards("ward")
+        self.district_shards = self._shards("district")
+
+    def _shards(self, level):
+        shards = []
+        for province_id in range(self.count("province")):
+            children = self.children(level, province_id)
+            if not children:
+                shards.append(None)
+                continue
+            shards.append(FuzzyIndex(self.normalized[level][children.start:children.stop]))
+        return tuple(shards)
+
+    @property
+    def province_names(self):
+        return self.names["province"]
+
+    def count(self, level):
+        return len(self.names[level])
+
+    def name(self, level, unit_id):
+        return self.names[level][unit_id]
+
+    def normalized_name(self, level, unit_id):
+        return self.normalized[level][unit_id]
+
+    def province_of(self, level, unit_id):
+        if level == "province":
+            return unit_id
+        return self.parents[level][unit_id]
+
+    def children(self, level, province_id):
+        """IDs of the districts or wards of a province, as a range"""
+        offsets = self.offsets[level]
+        return range(offsets[province_id], offsets[province_id + 1])
+
+    def unit(self, level, unit_id):
+        return AdminUnit(
+            level,
+            unit_id,
+            self.names[level][unit_id],
+            self.normalized[level][unit_id],
+            self.province_of(level, unit_id),
+        )
+
+    def ids(self, level, key):
+        """IDs of the units spelled exactly `key` (any accent, with or without prefix)"""
+        ids = self._keys[level].get(key)
+        if ids is None:
+            return ()
+        if isinstance(ids, int):
+            return (ids,)
+        return ids
+
+    def province_id(self, key):
+        ids = self.ids("province", key)
+        return ids[0] if ids else None
+
+    def has_unit(self, level, key, province_id):
+        """Whether `key` spells a unit of `level` in the given province exactly"""
+        parents = self.parents[level]
+        return any(parents[unit_id] == province_id for unit_id in self.ids(level, key))
+
+    def address_table(self, level):
+        """{province name: [unit names]}, the shape of data.load_*_address"""
+        table = {}
+        for province_id, province in enumerate(self.province_names):
+            children = self.children(level, province_id)
+            if children:
+                table[province] = list(self.names[level][children.start:children.stop])
+        return table
+
+
+def build_gazetteer(new_address_path=NEW_ADDRESS_PATH, old_address_path=OLD_ADDRESS_PATH):
+    NEW_ADDRESS = load_new_address(new_address_path)
+    OLD_ADDRESS = load_old_address(old_address_path)
+
+    return Gazetteer(
+        set(OLD_ADDRESS) | set(NEW_ADDRESS),
+        [(province, district) for province, districts in OLD_ADDRESS.items() for district in districts],
+        [(province, ward) for province, wards in NEW_ADDRESS.items() for ward in wards],
+        version=source_fingerprint((new_address_path, old_address_path)),
+    )
+
+
+_LEGACY_TABLES = (
+    "NEW_ADDRESS",
+    "OLD_ADDRESS",
+    "VN_PROVINCES_SET",
+    "VN_PROVINCE_DISTRICT_DICT",
+    "VN_PROVINCE_WARD_DICT",
+    "VN_PROVINCES_NORMALIZED_SET",
+    "PROVINCE_LOOKUP",
+)
+
+
+def legacy_table(name, gazetteer=None):
+    """Rebuild one of the dict/set tables the parser used to keep resident"""
+    gazetteer = gazetteer or load_gazetteer()
+    if name == "NEW_ADDRESS":
+        return gazetteer.address_table("ward")
+    if name == "OLD_ADDRESS":
+        return gazetteer.address_table("district")
+    if name == "VN_PROVINCES_SET":
+        return set(gazetteer.province_names)
+    if name == "VN_PROVINCES_NORMALIZED_SET":
+        return set(gazetteer.normalized["province"])
+    if name == "PROVINCE_LOOKUP":
+        return set(gazetteer.province_names) | set(gazetteer.normalized["province"])
+    if name in ("VN_PROVINCE_DISTRICT_DICT", "VN_PROVINCE_WARD_DICT"):
+        level = "district" if name == "VN_PROVINCE_DISTRICT_DICT" else "ward"
+        table = {}
+        for province_id, province in enumerate(gazetteer.province_names):
+            children = gazetteer.children(level, province_id)
+            if not children:
+                continue
+            names = list(gazetteer.names[level][children.start:children.stop])
+            names += gazetteer.normalized[level][children.start:children.stop]
+            table[province] = names
+            table[gazetteer.normalized["province"][province_id]] = names
+        return table
+    raise KeyError(name)
+
+
+def write_snapshot(path=SNAPSHOT_PATH):
+    gazetteer = build_gazetteer()
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "source": gazetteer.version,
+        "gazetteer": gazetteer,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return snapshot
+
+
+def read_snapshot(path=SNAPSHOT_PATH):
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except (FileNotFoundError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    if snapshot.get("source") != source_fingerprint():
+        return None
+    return snapshot["gazetteer"]
+
+
+def load_gazetteer():
+    """The active gazetteer, loaded from the snapshot or built on first use"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                gazetteer = read_snapshot()
+                if gazetteer is None:
+                    gazetteer = build_gazetteer()
+                _gazetteer = gazetteer
+    return _gazetteer
+
+
+def set_gazetteer(gazetteer):
+    """Make `gazetteer` the one `load_gazetteer` returns"""
+    global _gazetteer
+    with _gazetteer_lock:
+        _gazetteer = gazetteer
+
+
+if __name__ == "__main__":
+    # Through the importable module, so the pickle refers to
+    # gazetteer.Gazetteer rather than __main__.Gazetteer
+    import gazetteer
+
+    path = sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_PATH
+    gazetteer.write_snapshot(path)
+    print(f"Wrote gazetteer snapshot to {path}")
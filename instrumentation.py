@@ -0,0 +1,157 @@
+"""Pluggable measurements for the parser hot path.
+
+The parser reports what it does to the active recorder: how long each stage
+took (`stage`), which fuzzy tier matched a component and with what score
+(`match`), and plain event counts such as cache hits (`count`). With no
+recorder installed every report is a single context variable lookup.
+
+    recorder = MetricsRecorder()
+    with recording(recorder):
+        parse_address("Phường 5, Quận 3, TP. Hồ Chí Minh")
+    recorder.snapshot()
+
+Subclass `Recorder` to forward the numbers to another metrics system, for
+example as Prometheus histograms and counters. The recorder lives in a
+context variable, so `recording` scopes it to the current thread or asyncio
+task while `set_recorder` installs a process-wide default.
+
+Human-readable detail goes to the standard `logging` module instead, at
+DEBUG level under the module loggers ("parser", "ner", ...).
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+STAGES = ("preprocess", "ner", "province", "ward_district")
+
+_default_recorder = None
+_recorder = ContextVar("address_parser_recorder", default=None)
+
+
+class Recorder:
+    """Receives parser measurements; every method is a no-op by default"""
+
+    def stage(self, name: str, seconds: float):
+        pass
+
+    def match(self, level: str, tier: str, key: str, score):
+        pass
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+
+class MetricsRecorder(Recorder):
+    """In-memory recorder with per-stage totals and match/score histograms.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stage_seconds = defaultdict(float)
+            self.stage_calls = Counter()
+            self.matches = Counter()
+            self.scores = defaultdict(Counter)
+            self.counters = Counter()
+
+    def stage(self, name, seconds):
+        with self._lock:
+            self.stage_seconds[name] += seconds
+            self.stage_calls[name] += 1
+
+    def match(self, level, tier, key, score):
+        with self._lock:
+            self.matches[level, tier] += 1
+            if score is not None:
+                self.scores[level][score] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stage_seconds": dict(self.stage_seconds),
+                "stage_calls": dict(self.stage_calls),
+                "matches": {f"{level}.{tier}": n for (level, tier), n in self.matches.items()},
+                "scores": {level: dict(sorted(hist.items())) for level, hist in self.scores.items()},
+                "counters": dict(self.counters),
+            }
+
+
+def get_recorder():
+    recorder = _recorder.get()
+    return _default_recorder if recorder is None else recorder
+
+
+def set_recorder(recorder):
+    """Install `recorder` for the whole process, None to disable"""
+    global _default_recorder
+    _default_recorder = recorder
+
+
+@contextmanager
+def recording(recorder):
+    """Send the measurements of the enclosed code to `recorder`"""
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+class _Timer:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(name):
+    """Context manager timing the `name` stage, free when nothing records"""
+    recorder = get_recorder()
+    if recorder is None:
+        return _NULL_TIMER
+    return _Timer(recorder, name)
+
+
+def record_match(level, tier, key, score=None):
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.match(level, tier, key, score)
+
+
+def record_count(name, n=1):
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.count(name, n)
@@ -1,9 +1,422 @@
-from transformers import AutoTokenizer, AutoModelForTokenClassification
-from transformers import pipeline
+import queue
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from cache import LRUCache
+
+MODEL_NAME = "NlpHUST/ner-vietnamese-electra-base"
+
+
+class NerBackend:
+    """Token classification over a list of texts.
+
+    `predict` returns one list of raw token entities per text, in the format
+    of transformers' `pipeline("ner")` (entity, score, word, start, end).
+    """
+
+    def predict(self, texts, batch_size=32):
+        raise NotImplementedError
+
+
+class TransformersBackend(NerBackend):
+    """The HuggingFace pipeline, loaded on first use"""
+
+    def __init__(self, model_name=MODEL_NAME, device=-1, num_threads=None):
+        self.model_name = model_name
+        self.device = device
+        self.num_threads = num_threads
+        self._pipeline = None
+        self._lock = threading.Lock()
+
+    def _set_num_threads(self):
+        if self.num_threads is None:
+            return
+
+        import torch
+
+        if torch.get_num_threads() != self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+    def _load_model(self):
+        from transformers import AutoModelForTokenClassification
+
+        return AutoModelForTokenClassification.from_pretrained(self.model_name)
+
+    def _build_pipeline(self):
+        from transformers import AutoTokenizer, pipeline
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return pipeline("ner", model=self._load_model(), tokenizer=tokenizer, device=self.device)
+
+    def load(self):
+        if self._pipeline is None:
+            with self._lock:
+                if self._pipeline is None:
+                    self._set_num_threads()
+                    self._pipeline = self._build_pipeline()
+        return self._pipeline
+
+    def predict(self, texts, batch_size=32):
+        nlp = self.load()
+        self._set_num_threads()
+        return nlp(list(texts), batch_size=batch_size)
+
+
+class QuantizedBackend(TransformersBackend):
+    """The same model with its Linear layers dynamically quantized to int8.
+
+    `model_name` may be a local directory holding a saved checkpoint.
+    """
+
+    def _load_model(self):
+        import torch
+
+        model = super()._load_model()
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+class OnnxBackend(TransformersBackend):
+    """An ONNX export of the model run with onnxruntime on CPU.
+
+    Needs `optimum[onnxruntime]`; `model_name` is usually the local directory
+    written by `optimum-cli export onnx`.
+    """
+
+    def _load_model(self):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForTokenClassification
+
+        session_options = onnxruntime.SessionOptions()
+        if self.num_threads is not None:
+            session_options.intra_op_num_threads = self.num_threads
+
+        return ORTModelForTokenClassification.from_pretrained(
+            self.model_name, session_options=session_options
+        )
+
+    def _set_num_threads(self):
+        # Thread count is fixed in the onnxruntime session options
+        pass
+
+
+class StubBackend(NerBackend):
+    """Offline backend for tests and benchmarks.
+
+    Texts found in `responses` get their canned raw entities, anything else
+    has each comma-separated segment tagged as one LOCATION entity (or no
+    entities at all when `tag_segments` is False).
+    """
+
+    def __init__(self, responses=None, tag_segments=True):
+        self.responses = responses or {}
+        self.tag_segments = tag_segments
+
+    def _segment_entities(self, text):
+        entities = []
+        if not self.tag_segments:
+            return entities
+
+        for segment in re.finditer(r"[^,]+", text):
+            words = re.finditer(r"\S+", segment.group())
+            for i, word in enumerate(words):
+                entities.append({
+                    'entity': ('B-' if i == 0 else 'I-') + 'LOCATION',
+                    'score': 1.0,
+                    'index': len(entities) + 1,
+                    'word': word.group(),
+                    'start': segment.start() + word.start(),
+                    'end': segment.start() + word.end(),
+                })
+        return entities
+
+    def predict(self, texts, batch_size=32):
+        return [
+            self.responses[text] if text in self.responses else self._segment_entities(text)
+            for text in texts
+        ]
+
+
+SEGMENT_REGEX = re.compile(r"[^,]+")
+
+
+class SegmentCacheBackend(NerBackend):
+    """Runs `backend` on comma-separated segments and memoizes them.
+
+    Addresses share most of their segments ("Quận 1", "TP. Hồ Chí Minh"),
+    so each text is cut at its commas and only segments not in the LRU
+    cache (see `cache.LRUCache`) reach the model, deduplicated across the
+    batch. The cached token entities are shifted back to the segment's
+    offset in the text, giving the same format as whole-string NER.
+
+    The model then never sees the context across a comma, which can change
+    its tags; `benchmark.py --compare-segment-ner` measures how much.
+    """
+
+    def __init__(self, backend, max_entries=50000, max_bytes=None):
+        self.backend = backend
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+
+    def load(self):
+        if hasattr(self.backend, "load"):
+            return self.backend.load()
+
+    def _segments(self, text):
+        segments = []
+        for m in SEGMENT_REGEX.finditer(text):
+            segment = m.group()
+            stripped = segment.lstrip()
+            offset = m.start() + len(segment) - len(stripped)
+            stripped = stripped.rstrip()
+            if stripped:
+                segments.append((offset, stripped))
+        return segments
+
+    def predict(self, texts, batch_size=32):
+        texts = list(texts)
+        text_segments = [self._segments(text) for text in texts]
+
+        entities_by_segment = {}
+        unseen = []
+        for segments in text_segments:
+            for _, segment in segments:
+                if segment in entities_by_segment:
+                    continue
+                entities = self.cache.get(segment)
+                entities_by_segment[segment] = entities
+                if entities is None:
+                    unseen.append(segment)
+
+        if unseen:
+            for segment, entities in zip(unseen, self.backend.predict(unseen, batch_size=batch_size)):
+                entities_by_segment[segment] = entities
+                self.cache.put(segment, entities)
+
+        results = []
+        for segments in text_segments:
+            text_entities = []
+            for offset, segment in segments:
+                for ent in entities_by_segment[segment]:
+                    ent = dict(ent)
+                    ent['start'] += offset
+                    ent['end'] += offset
+                    ent['index'] = len(text_entities) + 1
+                    text_entities.append(ent)
+            results.append(text_entities)
+        return results
+
+
+# Ends the worker thread of a BatchingBackend
+_STOP = (None, None)
+
+# How often a caller waiting on a BatchingBackend checks its worker is alive
+_LIVENESS_INTERVAL = 0.5
+
+
+# Backend -> the lock every BatchingBackend wrapping it holds around its
+# model calls, so that wrappers created apart still take turns
+_model_locks = weakref.WeakKeyDictionary()
+_model_locks_lock = threading.Lock()
+
+
+def _model_lock(backend):
+    with _model_locks_lock:
+        lock = _model_locks.get(backend)
+        if lock is None:
+            lock = _model_locks[backend] = threading.Lock()
+        return lock
+
+
+def _fail_queued(requests, exc):
+    while True:
+        try:
+            item = requests.get_nowait()
+        except queue.Empty:
+            return
+        if item is not _STOP:
+            item[1].set_exception(exc)
+
+
+class BatchingBackend(NerBackend):
+    """Shares `backend` between threads, one model call at a time.
+
+    `predict` calls made from many threads at once are queued and run by a
+    worker thread, which merges the texts of the calls waiting at most
+    `max_wait_ms` after the first one into batches of about
+    `max_batch_size` and hands each caller its own results. The wrapped
+    backend never runs concurrently with itself, even when several
+    BatchingBackends wrap it.
+    """
+
+    def __init__(self, backend, max_batch_size=32, max_wait_ms=2.0):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._requests = None
+        self._worker = None
+        self._lock = threading.Lock()
+        # Held around model calls: other wrappers of `backend` share it, and
+        # a closing worker may still be finishing its queue when the next
+        # one starts
+        self._model_lock = _model_lock(backend)
+
+    def load(self):
+        if hasattr(self.backend, "load"):
+            return self.backend.load()
+
+    def close(self):
+        """Stop the worker thread once the calls queued so far are done"""
+        with self._lock:
+            worker = self._worker
+            if worker is None:
+                return
+            requests = self._requests
+            # A call arriving now starts a new worker with its own queue
+            self._worker = None
+            self._requests = None
+            requests.put(_STOP)
+        worker.join()
+        _fail_queued(requests, RuntimeError("BatchingBackend was closed"))
+
+    def predict(self, texts, batch_size=32):
+        texts = list(texts)
+        if not texts:
+            return []
+
+        future = Future()
+        with self._lock:
+            if self._worker is None:
+                self._requests = queue.SimpleQueue()
+                self._worker = threading.Thread(
+                    target=self._run, args=(self._requests,), name="ner-batching", daemon=True
+                )
+                self._worker.start()
+            worker = self._worker
+            self._requests.put((texts, future))
+
+        while True:
+            try:
+                return future.result(timeout=_LIVENESS_INTERVAL)
+            except FutureTimeoutError:
+                if not worker.is_alive() and not future.done():
+                    raise RuntimeError("the NER batching thread has stopped") from None
+
+    def _next_batch(self, requests):
+        # The first waiting call, and the calls arriving until the batch is
+        # full or `max_wait_ms` has passed; None once stopped
+        first = requests.get()
+        if first is _STOP:
+            return None
+
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Finish this batch first
+                requests.put(item)
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self, requests):
+        try:
+            while True:
+                batch = self._next_batch(requests)
+                if batch is None:
+                    return
+                self._run_batch(batch)
+        finally:
+            # Calls arriving from now on start a new worker, and nothing
+            # will serve what is left here
+            with self._lock:
+                if self._requests is requests:
+                    self._worker = None
+                    self._requests = None
+            _fail_queued(requests, RuntimeError("the NER batching thread has stopped"))
+
+    def _run_batch(self, batch):
+        texts = [text for call_texts, _ in batch for text in call_texts]
+        try:
+            with self._model_lock:
+                results = self.backend.predict(texts, batch_size=self.max_batch_size)
+        except BaseException as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            if not isinstance(exc, Exception):
+                raise
+            return
+
+        start = 0
+        for call_texts, future in batch:
+            future.set_result(results[start:start + len(call_texts)])
+            start += len(call_texts)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# A backend used instead of the process-wide one in the current context
+_pinned_backend = ContextVar("ner_backend", default=None)
+
+
+def get_backend():
+    backend = _pinned_backend.get()
+    if backend is not None:
+        return backend
+
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = TransformersBackend()
+    return _backend
+
+
+@contextmanager
+def using_backend(backend):
+    """Run the NER of the enclosed code on `backend`, in this context only"""
+    token = _pinned_backend.set(backend)
+    try:
+        yield backend
+    finally:
+        _pinned_backend.reset(token)
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def enable_segment_cache(max_entries=50000, max_bytes=None):
+    """Wrap the current backend in a `SegmentCacheBackend`"""
+    backend = get_backend()
+    if not isinstance(backend, SegmentCacheBackend):
+        backend = SegmentCacheBackend(backend, max_entries=max_entries, max_bytes=max_bytes)
+        set_backend(backend)
+    return backend
+
+
+def disable_segment_cache():
+    backend = get_backend()
+    if isinstance(backend, SegmentCacheBackend):
+        set_backend(backend.backend)
+
 
-tokenizer = AutoTokenizer.from_pretrained("NlpHUST/ner-vietnamese-electra-base")
-model = AutoModelForTokenClassification.from_pretrained("NlpHUST/ner-vietnamese-electra-base")
-nlp = pipeline("ner", model=model, tokenizer=tokenizer)
 def group_and_clean_entities(entities, text):
     """Group B- and I- tags and handle subword tokens (##)"""
     grouped = []
@@ -44,5 +457,17 @@ def group_and_clean_entities(entities, text):
     return grouped
 
 def ner(text):
-    entities = nlp(text)
+    entities = get_backend().predict([text])[0]
     return group_and_clean_entities(entities, text)
+
+def ner_batch(texts, batch_size=32):
+    """Run NER over many texts, letting the backend pad them into batches"""
+    texts = list(texts)
+    if not texts:
+        return []
+
+    batch_entities = get_backend().predict(texts, batch_size=batch_size)
+    return [
+        group_and_clean_entities(entities, text)
+        for entities, text in zip(batch_entities, texts)
+    ]
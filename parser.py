@@ -1,80 +1,159 @@
+import logging
 import re
-from fuzzywuzzy import fuzz, process
+import threading
+from collections import namedtuple
+from contextvars import ContextVar
 from utils import normalize_vietnamese, normalize_string, has_number
-from data import NEW_ADDRESS, OLD_ADDRESS, SPECIAL_PROVINCE_MAP_FULL, DASH_CASES, VN_PROVINCES_SET
-from copy import copy
-from ner import ner
+from data import (
+    SPECIAL_PROVINCE_MAP_FULL,
+    DASH_CASES,
+    PROVINCE_PREFIX_REGEX,
+    NEW_ADDRESS_PATH,
+    OLD_ADDRESS_PATH,
+)
+from cache import LRUCache
+from functools import lru_cache, wraps
+from fuzzywuzzy import fuzz
+from fuzzy_index import FuzzyIndex
+from gazetteer import LEVELS, build_gazetteer, load_gazetteer, legacy_table, set_gazetteer
+from instrumentation import timed, record_match, record_count
+from prefixes import classify_segment, expand_abbreviations, rules_generation, split_glued_prefixes
+from ner import ner, ner_batch
+from result import ParsedAddress
+from scanner import get_scanner, split_address
+
+logger = logging.getLogger(__name__)
+
+# Provinces, districts and wards with their fuzzy indexes, from the compiled
+# snapshot when it is up to date (see gazetteer.py)
+GAZETTEER = load_gazetteer()
+
+# The gazetteer a parse started with, so that a reload swapping GAZETTEER
+# doesn't change the data under a parse in progress
+_pinned_gazetteer = ContextVar("parser_gazetteer", default=None)
+_reload_lock = threading.Lock()
 
-VN_PROVINCE_DISTRICT_DICT = dict()
-VN_PROVINCE_WARD_DICT = dict()
+BUILDING_PREFIXES = {"ct", "hh", "bt", "ps", "ls", "cd"}  # , 'n'}
 
-for province, districts in OLD_ADDRESS.items():
-    province_normalized = normalize_vietnamese(province)
-    
-    clone = copy(districts)
-    
-    VN_PROVINCE_DISTRICT_DICT[province] = clone
-    VN_PROVINCE_DISTRICT_DICT[province_normalized] = VN_PROVINCE_DISTRICT_DICT[province]
-    
-    for district in districts:
-        district_normalied = normalize_vietnamese(district)
-        VN_PROVINCE_DISTRICT_DICT[province].append(district_normalied)
 
-for province, wards in NEW_ADDRESS.items():
-    province_normalized = normalize_vietnamese(province)
-    clone = copy(wards)
-    
-    VN_PROVINCE_WARD_DICT[province] = clone
-    VN_PROVINCE_WARD_DICT[province_normalized] = VN_PROVINCE_WARD_DICT[province]
-    
-    for ward in wards:
-        ward_normalized = normalize_vietnamese(ward)
-        VN_PROVINCE_WARD_DICT[province].append(ward_normalized)
+def __getattr__(name):
+    # The old dict/set tables (NEW_ADDRESS, VN_PROVINCE_WARD_DICT, ...) are
+    # no longer kept in memory, they are rebuilt from the gazetteer on access
+    try:
+        return legacy_table(name, _active_gazetteer())
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
 
 
-VN_PROVINCES_NORMALIZED_SET = {
-    normalize_vietnamese(province) for province in VN_PROVINCES_SET
-}
+def _active_gazetteer():
+    gazetteer = _pinned_gazetteer.get()
+    return GAZETTEER if gazetteer is None else gazetteer
 
-PROVINCE_LOOKUP = VN_PROVINCES_SET
-PROVINCE_LOOKUP.update(VN_PROVINCES_NORMALIZED_SET)
 
-# # Also create a set of all wards for faster searching
-# ALL_WARDS_SET = set()
-# for province, wards in NEW_ADDRESS.items():
-#     for ward in wards:
-#         ALL_WARDS_SET.add(normalize_string(ward))
+def _one_gazetteer(func):
+    # Run `func` on the gazetteer current when it's called, whatever reloads
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _pinned_gazetteer.set(_active_gazetteer())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _pinned_gazetteer.reset(token)
 
-# ALL_WARDS_SET_NORMALIZED = {normalize_vietnamese(ward) for ward in ALL_WARDS_SET}
+    return wrapper
 
-# DISTRICTS_SET = set()
-# for province, districts in OLD_ADDRESS.items():
-#     for district in districts:
-#         DISTRICTS_SET.add(normalize_string(district))
 
-# DISTRICTS_SET_NORMALIZED = {normalize_vietnamese(district) for district in DISTRICTS_SET}
+def gazetteer_version():
+    """Version (data file hash) of the gazetteer new parses use"""
+    return GAZETTEER.version
 
-DISTRICT_PREFIX_REGEX = re.compile(
-    r"^(?:q\.?\s?\d*|quan|quận|h\.?\s?|huyen|huyện|tp\.?|t\.p\.?|thanh pho|thành phố|thi xa|thị xã|tx\.?\s?)\b\.?,?\s*",
-    flags=re.IGNORECASE,
-)
 
-WARD_PREFIX_REGEX = re.compile(
-    r"^(?:p\.?\s?\d*|phuong|phường|xa|xã|x\.?|đặc khu|dac khu|dk\.?|thi tran|thị trấn|tt\.?|khu pho|khu phố|kp\.?)\b\.?,?\s*",
-    flags=re.IGNORECASE,
-)
+def reload_gazetteer(new_address_path=NEW_ADDRESS_PATH, old_address_path=OLD_ADDRESS_PATH, background=False):
+    """Rebuild the gazetteer from the data files and swap it in.
 
-PROVINCE_PREFIX_REGEX = re.compile(
-    r"^(?:tp\.?\s?|t\.?\s?|thanh pho|thành phố|tinh|tỉnh)\b\.?,?\s*",
-    flags=re.IGNORECASE,
-)
+    Building takes a while, and parses keep running on the current data
+    until the new gazetteer replaces it in one step; parses already in
+    progress then finish on the old one. The match caches and the result
+    cache are emptied, as their entries belong to the old data.
 
-STREET_ADDRESS_PREFIX_REGEX = re.compile(
-    r'^\b(?:\d+|số|đường|duong|phố|pho|tổ|to|lô|lo|thôn|thon|ngõ|ngo|ngách|ngach|hẻm|hem|toà nhà|toa nha\s)[\w\s,.-]+\b',
-    flags=re.IGNORECASE,
-)
+    With `background`, the rebuild runs on a new thread, which is returned;
+    otherwise the new gazetteer is.
+    """
+    if background:
+        thread = threading.Thread(
+            target=reload_gazetteer,
+            args=(new_address_path, old_address_path),
+            name="gazetteer-reload",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    with _reload_lock:
+        gazetteer = build_gazetteer(new_address_path, old_address_path)
+        get_scanner(gazetteer)
+        swap_gazetteer(gazetteer)
+    logger.info("Loaded gazetteer version %s", gazetteer.version)
+    return gazetteer
+
+
+def swap_gazetteer(gazetteer):
+    """Make `gazetteer` the one new parses use"""
+    global GAZETTEER
+    set_gazetteer(gazetteer)
+    GAZETTEER = gazetteer
+    _resolve_province.cache_clear()
+    _match_unit.cache_clear()
+    _search_index.cache_clear()
+    _level_index.cache_clear()
+    cache = RESULT_CACHE
+    if cache is not None:
+        cache.clear()
+
+
+def _exact_province_id(name, gazetteer=None):
+    if not name:
+        return None
 
-BUILDING_PREFIXES = {"ct", "hh", "bt", "ps", "ls", "cd"}  # , 'n'}
+    gazetteer = gazetteer or _active_gazetteer()
+    for key in (normalize_string(name), normalize_vietnamese(name)):
+        province_id = gazetteer.province_id(key)
+        if province_id is None:
+            province_id = gazetteer.province_id(PROVINCE_PREFIX_REGEX.sub("", key))
+        if province_id is not None:
+            return province_id
+
+    return None
+
+
+# What the memoized matchers return when nothing matches
+_NO_MATCH = (None, None, None, None)
+
+
+@lru_cache(maxsize=1024)
+def _resolve_province(gazetteer, name):
+    """(province ID, score, tier, canonical name) that `name` spells, memoized"""
+    if not name:
+        return _NO_MATCH
+
+    province_id = _exact_province_id(name, gazetteer)
+    if province_id is not None:
+        return province_id, 100, "exact", gazetteer.name("province", province_id)
+
+    spelling = normalize_string(name)
+    result = gazetteer.province_id_index.extract_one(normalize_vietnamese(spelling), score_cutoff=80)
+    if result:
+        province_id = _pick_unit(gazetteer, "province", result[0], None, spelling)
+        return province_id, result[1], "fuzzy", gazetteer.name("province", province_id)
+    return _NO_MATCH
+
+
+def resolve_province_id(name):
+    province_id, score, tier, matched = _resolve_province(_active_gazetteer(), name)
+    if province_id is not None:
+        # Logged here, as the memoized lookup only runs on a cache miss
+        logger.debug("Resolved province: %s Tier: %s Score: %s", matched, tier, score)
+    return province_id
 
 
 # Create normalized versions of DASH_CASES for better matching
@@ -84,198 +163,329 @@ DASH_CASES_NORMALIZED = [
 ]
 
 
+# Bit k (k + len(DASH_CASES) for the unaccented spelling) is set in a
+# segment's "opens" mask when it contains the first half of DASH_CASES[k],
+# and in its "closes" mask when it contains the second half
+_DASH_CASE_HALVES = [
+    [case_orig[half].lower() for case_orig in DASH_CASES] + [case_norm[half] for case_norm in DASH_CASES_NORMALIZED]
+    for half in (0, 1)
+]
+
+
+def _dash_case_mask(lowered, normalized, half):
+    mask = 0
+    for bit, case in enumerate(_DASH_CASE_HALVES[half]):
+        if case in (lowered if bit < len(DASH_CASES) else normalized):
+            mask |= 1 << bit
+    return mask
+
+
+def _alnum(word):
+    return "".join(e for e in word if e.isalnum())
+
+
 def handle_dash(str):
     if "-" not in str:
         return str
-    else:
-        sub_str_list = str.split("-")
-        new_str = ""
-        for i, sub_str in enumerate(sub_str_list):
-            if i != len(sub_str_list) - 1:
-                try:
-                    substr_before_dash = sub_str.strip().split(" ")[-1]
-                    substr_before_dash = "".join(
-                        e for e in substr_before_dash if e.isalnum()
-                    )
-
-                    substr_after_dash = sub_str_list[i + 1].strip().split(" ")[0]
-                    substr_after_dash = "".join(
-                        e for e in substr_after_dash if e.isalnum()
-                    )
-
-                except IndexError:
-                    return ""
-
-                # Check if this dash case should be preserved
-                should_keep_dash = False
-
-                # Check against DASH_CASES (both original and normalized)
-                current_part_lower = sub_str.lower()
-                next_part_lower = sub_str_list[i + 1].lower()
-                current_part_normalized = normalize_vietnamese(sub_str).lower()
-                next_part_normalized = normalize_vietnamese(sub_str_list[i + 1]).lower()
-
-                for case_orig, case_norm in zip(DASH_CASES, DASH_CASES_NORMALIZED):
-                    # Check original cases
-                    if (
-                        case_orig[0].lower() in current_part_lower
-                        and case_orig[1].lower() in next_part_lower
-                    ):
-                        should_keep_dash = True
-                        break
-
-                    # Check normalized cases
-                    if (
-                        case_norm[0] in current_part_normalized
-                        and case_norm[1] in next_part_normalized
-                    ):
-                        should_keep_dash = True
-                        break
-
-                # Original logic for other cases
-                if (
-                    should_keep_dash
-                    or (
-                        has_number(substr_before_dash) and has_number(substr_after_dash)
-                    )
-                    or (
-                        len(substr_after_dash) <= 2
-                        and substr_after_dash.lower() not in BUILDING_PREFIXES
-                    )
-                ):
-                    new_str += sub_str + "-"
-                else:
-                    new_str += sub_str + ","
-            else:
-                new_str += sub_str
-        return new_str
+
+    sub_str_list = str.split("-")
+
+    # Each segment is lowercased and normalized once, and checked against
+    # DASH_CASES only when the whole string contains a first half at all
+    opens = closes = None
+    lowered = str.lower()
+    normalized = normalize_vietnamese(str).lower()
+    n = len(DASH_CASES)
+    if any(case in (lowered if bit < n else normalized) for bit, case in enumerate(_DASH_CASE_HALVES[0])):
+        opens = []
+        closes = []
+        for sub_str in sub_str_list:
+            sub_lowered = sub_str.lower()
+            sub_normalized = normalize_vietnamese(sub_str).lower()
+            opens.append(_dash_case_mask(sub_lowered, sub_normalized, 0))
+            closes.append(_dash_case_mask(sub_lowered, sub_normalized, 1))
+
+    parts = []
+    for i, sub_str in enumerate(sub_str_list[:-1]):
+        substr_before_dash = _alnum(sub_str.strip().split(" ")[-1])
+        substr_after_dash = _alnum(sub_str_list[i + 1].strip().split(" ")[0])
+
+        # Check if this dash case should be preserved
+        should_keep_dash = opens is not None and bool(opens[i] & closes[i + 1])
+
+        # Original logic for other cases
+        if (
+            should_keep_dash
+            or (
+                has_number(substr_before_dash) and has_number(substr_after_dash)
+            )
+            or (
+                len(substr_after_dash) <= 2
+                and substr_after_dash.lower() not in BUILDING_PREFIXES
+            )
+        ):
+            parts.append(sub_str + "-")
+        else:
+            parts.append(sub_str + ",")
+
+    parts.append(sub_str_list[-1])
+    return "".join(parts)
+
+
+def _closest_spelling(spelling, names):
+    # The first of `names` (spellings sharing one unaccented key) nearest to
+    # the typed `spelling`, so that accents decide between "hòa" and "hóa"
+    if len(names) == 1 or normalize_vietnamese(spelling) == spelling:
+        return names[0]
+    return max(names, key=lambda name: fuzz.partial_ratio(spelling, name))
+
+
+def _pick_unit(gazetteer, level, key, province_id, spelling):
+    # The unit (of a province, or any with None) whose unaccented name is `key`
+    unit_ids = [
+        unit_id for unit_id in gazetteer.ids(level, key)
+        if province_id is None or gazetteer.province_of(level, unit_id) == province_id
+    ]
+    if not unit_ids:
+        return None
+    # Prefer full names over names only matching without their prefix
+    full = [unit_id for unit_id in unit_ids if gazetteer.normalized_name(level, unit_id) == key]
+    unit_ids = full or unit_ids
+    names = [gazetteer.name(level, unit_id) for unit_id in unit_ids]
+    return unit_ids[names.index(_closest_spelling(spelling, names))]
 
 
 def fuzzy_search_province(part, fuzzy_threshold=80):
     part_normalized_string = normalize_string(part)
     part_normalized_vietnamese = normalize_vietnamese(part)
+    gazetteer = _active_gazetteer()
 
-    result = process.extractOne(
-        part_normalized_vietnamese,
-        list(SPECIAL_PROVINCE_MAP_FULL.keys()),
-        scorer=fuzz.partial_ratio,
-        score_cutoff=fuzzy_threshold,
+    result = gazetteer.special_province_index.extract_one(
+        part_normalized_vietnamese, score_cutoff=fuzzy_threshold
     )
     if result:
         matched_key, score = result
-        print(
-            "Found province with special case:", matched_key,
-            SPECIAL_PROVINCE_MAP_FULL[matched_key],
-            "Score:",
-            score,
+        logger.debug(
+            "Found province with special case: %s %s Score: %s",
+            matched_key, SPECIAL_PROVINCE_MAP_FULL[matched_key], score,
         )
+        record_match("province", "special", matched_key, score)
         return SPECIAL_PROVINCE_MAP_FULL[matched_key]
 
-    # Find best match, with accentive fuzzy matching
-    result = process.extractOne(
-        part_normalized_string,
-        list(PROVINCE_LOOKUP),
-        scorer=fuzz.partial_ratio,
-        score_cutoff=fuzzy_threshold,
-    )
-
-    if result:
-        matched_key, score = result
-        print("Found province with accent:", matched_key, "Score:", score)
-        return matched_key
-
-    result = process.extractOne(
-        part_normalized_vietnamese,
-        list(PROVINCE_LOOKUP),
-        scorer=fuzz.partial_ratio,
-        score_cutoff=fuzzy_threshold,
-    )
+    # One pass over the unaccented names, mapped back to the accented one
+    result = gazetteer.province_index.extract_one(part_normalized_vietnamese, score_cutoff=fuzzy_threshold)
     if result:
         matched_key, score = result
-        print("Found province with unaccent:", matched_key, "Score:", score)
-        return matched_key
+        province_id = _pick_unit(gazetteer, "province", matched_key, None, part_normalized_string)
+        matched = gazetteer.name("province", province_id)
+        logger.debug("Found province: %s Score: %s", matched, score)
+        record_match("province", "fuzzy", matched, score)
+        return matched
 
     return None
 
-def fuzzy_search_ward(part, ward_set = None, fuzzy_threshold=90):    
-    if ward_set is None:
-        return None
-    
+@lru_cache(maxsize=64)
+def _search_index(choices):
+    # (FuzzyIndex over the unaccented keys, key -> spellings) of a frozenset
+    # or tuple of names, or of a FuzzyIndex, built once per set of choices
+    names = choices.choices if isinstance(choices, FuzzyIndex) else choices
+    spellings = {}
+    for name in names:
+        spellings.setdefault(normalize_vietnamese(name), []).append(name)
+    if isinstance(choices, FuzzyIndex) and len(spellings) == len(choices) and all(key in choices for key in spellings):
+        # Already keyed by unaccented names, like the gazetteer shards
+        return choices, spellings
+    return FuzzyIndex(spellings), spellings
+
+
+def _search_unit(level, part, choices, fuzzy_threshold):
+    # (choice, score) of a ward or district `part` among the names `choices`,
+    # matched once on their unaccented keys
     part_normalized_string = normalize_string(part)
     part_normalized_vietnamese = normalize_vietnamese(part)
 
-    result = process.extractOne(
-        part_normalized_string,
-        list(ward_set),
-        scorer=fuzz.partial_ratio,
-        score_cutoff=fuzzy_threshold,
-    )
-    if result:
-        matched_key, score = result
-        print("Found ward with accent:", matched_key, "Score:", score)
-        return matched_key
-
-    result = process.extractOne(
-        part_normalized_vietnamese,
-        list(ward_set),
-        scorer=fuzz.partial_ratio,
-        score_cutoff=fuzzy_threshold,
-    )
-    if result:
-        matched_key, score = result
-        print("Found ward with unaccent:", matched_key, "Score:", score)
-        return matched_key
-    
-    return None
+    if isinstance(choices, (set, dict)):
+        choices = frozenset(choices)
+    elif not isinstance(choices, (FuzzyIndex, frozenset, tuple)):
+        choices = tuple(choices)
+    index, spellings = _search_index(choices)
+
+    if part_normalized_vietnamese in spellings:
+        matched_key, score, tier = part_normalized_vietnamese, 100, "exact"
+    else:
+        result = index.extract_one(part_normalized_vietnamese, score_cutoff=fuzzy_threshold)
+        if not result:
+            return None, None
+        (matched_key, score), tier = result, "fuzzy"
+
+    matched = _closest_spelling(part_normalized_string, spellings[matched_key])
+    logger.debug("Found %s: %s Score: %s", level, matched, score)
+    record_match(level, tier, matched, score)
+    return matched, score
+
+
+def fuzzy_search_ward(part, ward_set = None, fuzzy_threshold=90):    
+    if ward_set is None:
+        return None
+    return _search_unit("ward", part, ward_set, fuzzy_threshold)[0]
 
 def fuzzy_search_district(part, district_set = None, fuzzy_threshold=90):
     if district_set is None:
         return
-    
+    return _search_unit("district", part, district_set, fuzzy_threshold)[0]
+
+
+@lru_cache(maxsize=4096)
+def _match_unit(gazetteer, level, part, province_id, fuzzy_threshold=90):
+    """(unit ID, score, tier, canonical name) of the ward or district of a
+    province `part` names, memoized; `_find_unit` reports the match"""
+    if province_id is None:
+        return _NO_MATCH
+
+    shards = gazetteer.ward_shards if level == "ward" else gazetteer.district_shards
+    shard = shards[province_id]
+    if shard is None:
+        return _NO_MATCH
+
+    part_normalized_string = normalize_string(part)
+    matched_key = normalize_vietnamese(part_normalized_string)
+    # Exact gazetteer hits need no fuzzy scoring
+    if matched_key in shard:
+        score, tier = 100, "exact"
+    else:
+        result = shard.extract_one(matched_key, score_cutoff=fuzzy_threshold)
+        if not result:
+            return _NO_MATCH
+        (matched_key, score), tier = result, "fuzzy"
+
+    unit_id = _pick_unit(gazetteer, level, matched_key, province_id, part_normalized_string)
+    return unit_id, score, tier, gazetteer.name(level, unit_id)
+
+
+def _find_unit(level, part, province_id):
+    # The ID `_match_unit` gives `part`, with the match logged and recorded
+    # on every call, cached or not
+    unit_id, score, tier, matched = _match_unit(_active_gazetteer(), level, part, province_id)
+    if unit_id is not None:
+        logger.debug("Found %s: %s Score: %s", level, matched, score)
+        record_match(level, tier, matched, score)
+    return unit_id
+
+
+# One possible reading of an address part, see `candidates`
+Candidate = namedtuple("Candidate", "level id name province_id score tier")
+
+_TIER_RANK = {"exact": 0, "special": 1, "fuzzy": 2}
+
+
+@lru_cache(maxsize=8)
+def _level_index(gazetteer, level):
+    # FuzzyIndex over the unaccented names of every ward or district, so a
+    # query without a province is one search instead of one per shard
+    return FuzzyIndex(gazetteer.normalized[level])
+
+
+def _candidate_index(gazetteer, level, province_id):
+    # The fuzzy index to search for `level`, None when there's nothing to search
+    if level == "province":
+        return gazetteer.province_id_index
+    if province_id is None:
+        return _level_index(gazetteer, level)
+    shards = gazetteer.ward_shards if level == "ward" else gazetteer.district_shards
+    return shards[province_id]
+
+
+@_one_gazetteer
+def candidates(part, level="ward", province=None, limit=5, score_cutoff=60):
+    """The `limit` gazetteer units of `level` that `part` most likely names.
+
+    Returns `Candidate`s, best score first. `province` (an ID or a name)
+    restricts districts and wards to that province. A part spelling a unit
+    exactly, with or without accents and prefix, only returns those units
+    with tier "exact" and score 100, without any fuzzy scoring; otherwise
+    the tiers are "special" (province aliases) and "fuzzy". Units whose
+    names differ only in accents score alike, and rank by how close their
+    accented name is to `part`. Abbreviations ("tphcm", "q.1") are expanded
+    first, as `parse_address` expands them.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"unknown level {level!r}, expected one of {LEVELS}")
+    part = classify_segment(expand_abbreviations(part)).text
+    if not normalize_string(part) or limit <= 0:
+        return []
+    gazetteer = _active_gazetteer()
+    if isinstance(province, int):
+        if not 0 <= province < gazetteer.count("province"):
+            return []
+    elif province is not None:
+        province = _resolve_province(gazetteer, province)[0]
+        if province is None:
+            return []
+
     part_normalized_string = normalize_string(part)
     part_normalized_vietnamese = normalize_vietnamese(part)
-    
-    result = process.extractOne(
-        part_normalized_string,
-        list(district_set),
-        scorer=fuzz.partial_ratio,
-        score_cutoff=fuzzy_threshold,
-    )
-    if result:
-        matched_key, score = result
-        print("Found district with accent:", matched_key, "Score:", score)
-        return matched_key
-    
-    result = process.extractOne(
-        part_normalized_vietnamese,
-        list(district_set),
-        scorer=fuzz.partial_ratio,
-        score_cutoff=fuzzy_threshold,
-    )
-    if result:
-        matched_key, score = result
-        print("Found district with unaccent:", matched_key, "Score:", score)
-        return matched_key
-    
-    return None
+    found = {}
+
+    def add(unit_id, score, tier):
+        if province is not None and gazetteer.province_of(level, unit_id) != province:
+            return
+        current = found.get(unit_id)
+        if current is None or (-score, _TIER_RANK[tier]) < (-current[0], _TIER_RANK[current[1]]):
+            found[unit_id] = (score, tier)
+
+    for key in (part_normalized_string, part_normalized_vietnamese):
+        for unit_id in gazetteer.ids(level, key):
+            add(unit_id, 100, "exact")
+
+    if not found:
+        if level == "province":
+            special = gazetteer.special_province_index.extract_top(
+                part_normalized_vietnamese, limit=limit, score_cutoff=score_cutoff
+            )
+            for key, score in special:
+                province_id = _resolve_province(gazetteer, SPECIAL_PROVINCE_MAP_FULL[key])[0]
+                if province_id is not None:
+                    add(province_id, score, "special")
+
+        index = _candidate_index(gazetteer, level, province)
+        if index is not None:
+            # `add` drops the units of other provinces sharing a key
+            for key, score in index.extract_top(part_normalized_vietnamese, limit=limit, score_cutoff=score_cutoff):
+                for unit_id in gazetteer.ids(level, key):
+                    add(unit_id, score, "fuzzy")
+
+    accented = part_normalized_string != part_normalized_vietnamese
+
+    def rank(item):
+        unit_id, (score, tier) = item
+        closeness = fuzz.partial_ratio(part_normalized_string, gazetteer.name(level, unit_id)) if accented else 0
+        return -score, _TIER_RANK[tier], -closeness, unit_id
+
+    ranked = sorted(found.items(), key=rank)
+    return [
+        Candidate(level, unit_id, gazetteer.name(level, unit_id), gazetteer.province_of(level, unit_id), score, tier)
+        for unit_id, (score, tier) in ranked[:limit]
+    ]
 
 def has_district_prefix(part):
-    return bool(DISTRICT_PREFIX_REGEX.search(part))
+    return "district" in classify_segment(part).levels
 
 
 def has_ward_prefix(part):
-    return bool(WARD_PREFIX_REGEX.search(part))
+    return "ward" in classify_segment(part).levels
 
 
 def has_province_prefix(part):
-    return bool(PROVINCE_PREFIX_REGEX.search(part))
+    return "province" in classify_segment(part).levels
 
 def has_street_address_prefix(part):
-    return bool(STREET_ADDRESS_PREFIX_REGEX.search(part))
+    return "street" in classify_segment(part).levels
 
 def find_ctryname(part):
-    if has_province_prefix(part):
-        return part
+    segment = classify_segment(part)
+    if "province" in segment.levels:
+        record_match("province", "prefix", segment.text)
+        return segment.text
 
     return fuzzy_search_province(part)
 
@@ -291,14 +501,18 @@ def _normalize_result(parsed_result: dict) -> dict:
     return normalized_result
 
 
-def _find_province(parts: list[str], force=False):
+def _find_province(parts: list[str], segments: list, force=False):
     for i, part in enumerate(parts):
         lowered = part.lower()
         
         if force:
             return i, lowered
+        elif "province" in segments[i].levels:
+            record_match("province", "prefix", segments[i].text)
+            return i, segments[i].text
         else:
-            found = find_ctryname(lowered)
+            # Unexpanded, as the special aliases are spelled ("tt hue")
+            found = fuzzy_search_province(lowered)
             if found:
                 return i, found
     
@@ -312,16 +526,17 @@ def _parse_address(parts: list[str], force=False) -> dict:
     }
 
     parts = parts[::-1]
+    # Every part is labelled once, and matched with its prefix expanded
+    segments = [classify_segment(part) for part in parts]
 
     last_parsed = None    
     
-    ward_set = None
-    district_set = None
-
     visited_indices = set()
-    province_index, result["ctryname"] = _find_province(parts, force=force)
+    with timed("province"):
+        province_index, result["ctryname"] = _find_province(parts, segments, force=force)
+    parts = [segment.text for segment in segments]
     if province_index is not None:
-        print("Found province:", result["ctryname"], "Index:", province_index)
+        logger.debug("Found province: %s Index: %s", result["ctryname"], province_index)
         last_parsed = "ctryname"
         visited_indices.add(province_index)
 
@@ -329,9 +544,10 @@ def _parse_address(parts: list[str], force=False) -> dict:
         if not part or i in visited_indices:
             continue
 
-        lowered = part.lower()
+        lowered = part
+        levels = segments[i].levels
 
-        if has_ward_prefix(lowered):
+        if "ward" in levels:
             if not result["ctrysubsubdivname"]:
                 result["ctrysubsubdivname"] = [lowered]
                 last_parsed = "ctrysubsubdivname"
@@ -343,7 +559,7 @@ def _parse_address(parts: list[str], force=False) -> dict:
                 
                 continue
         
-        if has_district_prefix(lowered):
+        if "district" in levels:
             if not result["ctrysubdivname"]:
                 result["ctrysubdivname"] = lowered
                 last_parsed = "ctrysubdivname"
@@ -358,7 +574,7 @@ def _parse_address(parts: list[str], force=False) -> dict:
                 if i < len(parts) - 1 and i + 1 != province_index and not result["ctrysubsubdivname"]:
                     # This maybe a street address. Check first
                     checking_part = parts[i + 1]
-                    if has_street_address_prefix(checking_part):
+                    if "street" in segments[i + 1].levels:
                         continue
 
                     result["ctrysubsubdivname"] = [checking_part]
@@ -366,34 +582,24 @@ def _parse_address(parts: list[str], force=False) -> dict:
                 
                 continue
 
+    with timed("province"):
+        province_id = resolve_province_id(result["ctryname"])
+
     for i, part in enumerate(parts):
         if not part or i in visited_indices:
             continue
 
-        lowered = part.lower()
+        lowered = part
 
         if not result["ctrysubsubdivname"]:             
-            if last_parsed == "ctrysubdivname" and not has_street_address_prefix(lowered):                
+            if last_parsed == "ctrysubdivname" and "street" not in segments[i].levels:                
                 result["ctrysubsubdivname"] = [lowered]
                 last_parsed = "ctrysubsubdivname"
                 visited_indices.add(i)
                 continue
 
-            if result["ctryname"] and ward_set is None:                
-                new_province_matched = process.extractBests(
-                    result["ctryname"],
-                    VN_PROVINCE_WARD_DICT.keys(),
-                    scorer=fuzz.partial_ratio,
-                    score_cutoff=80,
-                    limit=5,
-                )
-                
-                if new_province_matched:
-                    ward_set = set()
-                    for province in new_province_matched:
-                        ward_set.update(VN_PROVINCE_WARD_DICT[province[0]])
-            
-            found = fuzzy_search_ward(lowered, ward_set)
+            with timed("ward_district"):
+                found = _find_unit("ward", lowered, province_id) is not None
             if found:
                 result["ctrysubsubdivname"] = [lowered]
                 last_parsed = "ctrysubsubdivname"
@@ -404,22 +610,10 @@ def _parse_address(parts: list[str], force=False) -> dict:
                 # Detected as new address, pass this
                 continue
             
-            if result["ctryname"] and district_set is None:
-                old_province_matched = process.extractBests(
-                    result["ctryname"],
-                    VN_PROVINCE_DISTRICT_DICT.keys(),
-                    scorer=fuzz.partial_ratio,
-                    score_cutoff=80,
-                    limit=5,
-                )
-                if old_province_matched:
-                    district_set = set()
-                    for province in old_province_matched:
-                        district_set.update(VN_PROVINCE_DISTRICT_DICT[province[0]])
-                    
-            found = fuzzy_search_district(lowered, district_set)
-            if found:
-                result["ctrysubdivname"] = [found]
+            with timed("ward_district"):
+                district_id = _find_unit("district", lowered, province_id)
+            if district_id is not None:
+                result["ctrysubdivname"] = [_active_gazetteer().name("district", district_id)]
                 last_parsed = "ctrysubdivname"
                 visited_indices.add(i)
                 
@@ -446,42 +640,44 @@ def _parse_address(parts: list[str], force=False) -> dict:
 
 
 def handle_dup_substr(str):
-    try:
-        for i in range(len(str) // 2, -1, -1):
-            idx = str[i:].find(str[:i])
-            if idx != -1 and idx < 5 and str[i] == ",":
-                return str[i + idx :]
-        return str
-    except IndexError:
-        return str
+    # Drop the first copy of a duplicated leading run: the longest prefix
+    # str[:i], i <= len(str) // 2, that ends at a comma and occurs again
+    # starting within 5 characters of it. Only comma positions can qualify,
+    # and the search for the repeat is bounded to where it may start.
+    i = str.rfind(",", 0, len(str) // 2 + 1)
+    while i != -1:
+        if str.find(str[:1], i, i + 5) != -1:
+            idx = str.find(str[:i], i, 2 * i + 4)
+            if idx != -1:
+                return str[idx:]
+        i = str.rfind(",", 0, i)
+    return str
 
 
 def remove_redunts(str):
-    str_list = [x for x in str.split(",") if x.strip() != ""]
-    res = ""
-    for sub_str in str_list:
-        res += sub_str + ","
-    return res[:-1].strip()
+    return ",".join(x for x in str.split(",") if x.strip() != "").strip()
 
 
-def parse_address(address: str) -> dict:
-    address = re.sub(
-        r"\b(việt nam|vietnam|vn)\b", "", address, flags=re.IGNORECASE
-    ).strip()
+COUNTRY_REGEX = re.compile(r"\b(việt nam|vietnam|vn)\b", flags=re.IGNORECASE)
+
+
+def _clean_address(address: str) -> str:
+    address = COUNTRY_REGEX.sub("", address).strip()
+    address = expand_abbreviations(address)
+    # Before the dots go, "P.Long Hưng" would become "PLong Hưng"
+    address = split_glued_prefixes(address)
 
-    address = re.sub(r"\bhcm\b", " Hồ Chí Minh", address, flags=re.IGNORECASE)
-    address = re.sub(r"\btphcm\b", "Thành phố Hồ Chí Minh", address, flags=re.IGNORECASE)
-    
     address = remove_redunts(handle_dup_substr(address.replace(".", "")))
-    address = handle_dash(address)
+    return handle_dash(address)
 
-    entities = ner(address)
+
+def _parse_entities(address: str, entities: list[dict]) -> dict:
     parts = []
     for entity in entities:
         if entity["entity"] == "LOCATION":
             parts.append(normalize_string(entity["word"]))
     
-    print("After NER", parts)
+    logger.debug("After NER %s", parts)
     
     parsed_result = _parse_address(parts)
     if parsed_result["ctryname"]:
@@ -489,3 +685,230 @@ def parse_address(address: str) -> dict:
 
     return _parse_address(address, force=True)
 
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else ""
+    return value
+
+
+def _is_confident(result: dict) -> bool:
+    gazetteer = _active_gazetteer()
+    province_id = _exact_province_id(result["ctryname"], gazetteer)
+    if province_id is None:
+        return False
+
+    ward = _first(result["ctrysubsubdivname"])
+    district = _first(result["ctrysubdivname"])
+    ward_found = bool(ward) and (
+        gazetteer.has_unit("ward", ward, province_id)
+        or gazetteer.has_unit("ward", normalize_vietnamese(ward), province_id)
+    )
+    district_found = bool(district) and (
+        gazetteer.has_unit("district", district, province_id)
+        or gazetteer.has_unit("district", normalize_vietnamese(district), province_id)
+    )
+    if not ward_found and not district_found:
+        return False
+
+    # A unit the gazetteer can't confirm must at least be labelled by its prefix
+    if ward and not ward_found and not has_ward_prefix(ward):
+        return False
+    if district and not district_found and not has_district_prefix(district):
+        return False
+
+    return True
+
+
+def _parse_rules(address: str):
+    # Comma splitting stands in for NER on well-formed input; only keep the
+    # result when the province and a ward or district are exact gazetteer hits.
+    # Without commas, the gazetteer scanner cuts the address at exact names.
+    if "," in address:
+        parts = address.split(",")
+    else:
+        parts = split_address(address, _active_gazetteer())
+    parts = [normalize_string(part) for part in parts if part.strip()]
+    result = _parse_address(parts)
+    if _is_confident(result):
+        result["source"] = "rules"
+        return result
+
+    return None
+
+
+# Optional result cache keyed on the cleaned, normalized address, the
+# gazetteer version and the prefix rules
+RESULT_CACHE = None
+
+
+def enable_cache(max_entries=10000, max_bytes=None):
+    """Cache parse results in a bounded LRU, see `cache.LRUCache`"""
+    global RESULT_CACHE
+    RESULT_CACHE = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+    return RESULT_CACHE
+
+
+def disable_cache():
+    global RESULT_CACHE
+    RESULT_CACHE = None
+
+
+def cache_stats():
+    if RESULT_CACHE is None:
+        return None
+    return RESULT_CACHE.stats()
+
+
+def _cache_key(address: str, cascade: bool):
+    # The generation stands for the prefix rules the result was parsed with
+    return normalize_string(address), cascade, _active_gazetteer().version, rules_generation()
+
+
+def _resolve_unit(level, name, province_id):
+    # (ID, score) of the district or ward of a province that `name` spells
+    if not name:
+        return None, None
+
+    # The unit _match_unit picked, even where a province has several of
+    # the same name. The parse already reported the match
+    return _match_unit(_active_gazetteer(), level, name, province_id)[:2]
+
+
+def _make_result(address: str, parsed: dict) -> ParsedAddress:
+    # Resolve the picked parts to gazetteer units. A missing province comes
+    # out of _normalize_result as the string "none"
+    gazetteer = _active_gazetteer()
+    ctryname = parsed["ctryname"]
+    province_id, province_score = _resolve_province(gazetteer, ctryname if ctryname != "none" else "")[:2]
+    district_id, district_score = _resolve_unit("district", _first(parsed["ctrysubdivname"]), province_id)
+    ward_id, ward_score = _resolve_unit("ward", _first(parsed["ctrysubsubdivname"]), province_id)
+
+    return ParsedAddress(
+        text=address,
+        ctryname=ctryname,
+        ctrysubdivname=parsed["ctrysubdivname"],
+        ctrysubsubdivname=parsed["ctrysubsubdivname"],
+        source=parsed.get("source"),
+        province_id=province_id,
+        district_id=district_id,
+        ward_id=ward_id,
+        province=gazetteer.name("province", province_id) if province_id is not None else None,
+        district=gazetteer.name("district", district_id) if district_id is not None else None,
+        ward=gazetteer.name("ward", ward_id) if ward_id is not None else None,
+        province_score=province_score,
+        district_score=district_score,
+        ward_score=ward_score,
+    )
+
+
+@_one_gazetteer
+def parse_address(address: str, cascade=False) -> ParsedAddress:
+    """Parse a single address into a `ParsedAddress`.
+
+    With `cascade`, a rule-only parse verified against the gazetteer is tried
+    first and NER only runs when it isn't confident. The result's `source`
+    then tells which path ("rules" or "ner") produced it.
+
+    Results are shared with the cache and must not be modified; use
+    `to_dict()` for the dict this function used to return.
+    """
+    with timed("preprocess"):
+        address = _clean_address(address)
+
+    cache = RESULT_CACHE
+    if cache is not None:
+        key = _cache_key(address, cascade)
+        cached = cache.get(key)
+        if cached is not None:
+            record_count("cache_hit")
+            return cached
+        record_count("cache_miss")
+
+    parsed = None
+    if cascade:
+        parsed = _parse_rules(address)
+
+    if parsed is None:
+        with timed("ner"):
+            entities = ner(address)
+        parsed = _parse_entities(address, entities)
+        if cascade:
+            parsed["source"] = "ner"
+    if cascade:
+        record_count("source_" + parsed["source"])
+
+    result = _make_result(address, parsed)
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+@_one_gazetteer
+def _parse_batch(addresses: list[str], batch_size: int, cascade=False) -> list[ParsedAddress]:
+    cache = RESULT_CACHE
+    keys = [_cache_key(address, cascade) for address in addresses]
+
+    # Identical inputs are parsed once, and only unseen ones reach NER
+    results = {}
+    pending = {}
+    for address, key in zip(addresses, keys):
+        if key in results or key in pending:
+            continue
+
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                record_count("cache_hit")
+                results[key] = cached
+                continue
+            record_count("cache_miss")
+
+        if cascade:
+            parsed = _parse_rules(address)
+            if parsed is not None:
+                record_count("source_rules")
+                results[key] = _make_result(address, parsed)
+                if cache is not None:
+                    cache.put(key, results[key])
+                continue
+
+        pending[key] = address
+
+    if pending:
+        with timed("ner"):
+            batch_entities = ner_batch(pending.values(), batch_size=batch_size)
+    else:
+        batch_entities = []
+    for (key, address), entities in zip(pending.items(), batch_entities):
+        parsed = _parse_entities(address, entities)
+        if cascade:
+            parsed["source"] = "ner"
+            record_count("source_ner")
+
+        results[key] = _make_result(address, parsed)
+        if cache is not None:
+            cache.put(key, results[key])
+
+    return [results[key] for key in keys]
+
+
+def parse_addresses(addresses, batch_size=32, cascade=False):
+    """Parse an iterable of addresses, running NER over padded batches.
+
+    Results are yielded lazily and in input order, so arbitrarily long
+    iterables can be streamed through without holding them in memory.
+    Duplicates within a batch are parsed once, and with `cascade` only
+    addresses the rule-only parse can't settle are sent to the NER model
+    (see `parse_address`).
+    """
+    batch = []
+    for address in addresses:
+        with timed("preprocess"):
+            batch.append(_clean_address(address))
+        if len(batch) >= batch_size:
+            yield from _parse_batch(batch, batch_size, cascade=cascade)
+            batch = []
+
+    if batch:
+        yield from _parse_batch(batch, batch_size, cascade=cascade)
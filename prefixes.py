@@ -0,0 +1,173 @@
+"""Label address segments by their leading words, in one pass.
+
+`PREFIX_RULES` (data.py) lists the spellings that start a province,
+district, ward or street segment. `PrefixClassifier` compiles them into a
+table keyed by the first word, so classifying a segment is one
+tokenization and a few dict probes, longest spelling first:
+
+    classify_segment("Q.1")
+    Segment(text='quận 1', levels=frozenset({'district'}))
+
+Abbreviations come back expanded, which is the text the parser matches
+against the gazetteer. `expand_abbreviations` does the same for the
+whole-word `ADDRESS_ABBREVIATIONS` of a raw address ("tphcm"), and
+`split_glued_prefixes` keeps "P.Long Hưng" a prefix and a name once the
+parser drops the dots.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from data import ADDRESS_ABBREVIATIONS, PREFIX_RULES
+from utils import normalize_vietnamese
+
+# `text` is the lowercased segment with its prefix expanded, `levels` the
+# frozenset of levels ("province", "district", "ward", "street") it may be
+Segment = namedtuple("Segment", "text levels")
+
+# Letters and digits are separate words, so "q1" reads as "q 1"
+_WORD_REGEX = re.compile(r"\d+|[^\W\d_]+")
+
+# What may come between the words of a prefix and after it
+_SEPARATOR_REGEX = re.compile(r"[\s.]*")
+_TRAILING_REGEX = re.compile(r"[\s.,:]*")
+
+_NO_LEVELS = frozenset()
+_STREET = frozenset(("street",))
+
+
+class PrefixClassifier:
+    """Compiled `PREFIX_RULES`: first word -> [(words, levels, expansion)]"""
+
+    __slots__ = ("rules", "_table", "_level_prefixes", "_glued")
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._table = {}
+        prefixes = {}
+        for spelling, levels, expansion in self.rules:
+            words = tuple(spelling.lower().split())
+            self._table.setdefault(words[0], []).append((words, frozenset(levels), expansion))
+            for level in levels:
+                prefixes.setdefault(level, set()).add(tuple(normalize_vietnamese(spelling.lower()).split()))
+        for entries in self._table.values():
+            entries.sort(key=lambda entry: -len(entry[0]))
+        self._level_prefixes = {
+            level: tuple(sorted(words, key=lambda words: (-len(words), words)))
+            for level, words in prefixes.items()
+        }
+        # A prefix, then a dot with a letter right after it
+        spellings = sorted({words for entries in self._table.values() for words, _, _ in entries}, key=len, reverse=True)
+        self._glued = re.compile(
+            r"(?<![^\W_])(?:"
+            + "|".join(r"[\s.]*".join(map(re.escape, words)) for words in spellings)
+            + r")\.(?=[^\W\d_])",
+            flags=re.IGNORECASE,
+        )
+
+    def classify(self, part):
+        """The `Segment` of one address part"""
+        text = part.lower().strip()
+        words = list(_WORD_REGEX.finditer(text))
+        if not words or words[0].start() != 0:
+            return Segment(text, _NO_LEVELS)
+
+        first = words[0].group()
+        if first.isdigit():
+            # "12 lê lợi", "12", but not a single digit
+            return Segment(text, _STREET if len(text) > 1 else _NO_LEVELS)
+
+        for rule_words, levels, expansion in self._table.get(first, ()):
+            end = self._match(text, words, rule_words)
+            if end is None:
+                continue
+            if expansion:
+                rest = text[_TRAILING_REGEX.match(text, end).end():]
+                text = f"{expansion} {rest}" if rest else expansion
+            return Segment(text, levels)
+        return Segment(text, _NO_LEVELS)
+
+    @staticmethod
+    def _match(text, words, rule_words):
+        # End of the prefix in `text` when its first words are `rule_words`,
+        # separated by nothing but spaces and dots
+        if len(words) < len(rule_words):
+            return None
+        for i in range(1, len(rule_words)):
+            if words[i].group() != rule_words[i]:
+                return None
+            if _SEPARATOR_REGEX.fullmatch(text, words[i - 1].end(), words[i].start()) is None:
+                return None
+        end = words[len(rule_words) - 1].end()
+        if len(words) > len(rule_words) and words[len(rule_words)].start() == end:
+            # Only a number may be glued to a prefix
+            if not words[len(rule_words)].group().isdigit():
+                return None
+        return end
+
+    def level_prefixes(self, level):
+        """Unaccented word tuples of the prefixes of `level`, longest first"""
+        return self._level_prefixes.get(level, ())
+
+    def split_glued(self, address):
+        """`address` with a space after the dot of "P.Long Hưng", "TX.Sơn Tây" """
+        return self._glued.sub(lambda match: match.group() + " ", address)
+
+
+_classifier = PrefixClassifier(PREFIX_RULES)
+# Bumped by every set_prefix_rules
+_generation = 0
+
+
+def set_prefix_rules(rules):
+    """Replace the rules used by `classify_segment`, e.g. PREFIX_RULES plus a few rows.
+
+    The scanner reads its prefixes from the current classifier, and the
+    parser's result cache is keyed by `rules_generation`, so neither keeps
+    what the old rules made.
+    """
+    global _classifier, _generation
+    _classifier = PrefixClassifier(rules)
+    _generation += 1
+    classify_segment.cache_clear()
+
+
+def get_classifier():
+    return _classifier
+
+
+def split_glued_prefixes(address):
+    """`address` with prefixes glued to a name by a dot ("TX.Sơn Tây") spaced
+    apart, so that they survive the parser dropping the dots"""
+    return _classifier.split_glued(address)
+
+
+def rules_generation():
+    """Small integer that changes whenever the rules are replaced"""
+    return _generation
+
+
+@lru_cache(maxsize=16384)
+def classify_segment(part):
+    """The `Segment` of `part` under the current rules"""
+    return _classifier.classify(part)
+
+
+_ABBREVIATION_REGEX = re.compile(
+    r"\b(?:" + "|".join(re.escape(word) for word in sorted(ADDRESS_ABBREVIATIONS, key=len, reverse=True)) + r")\b",
+    flags=re.IGNORECASE,
+)
+
+
+def _expand(match):
+    expansion = ADDRESS_ABBREVIATIONS[match.group().lower()]
+    start = match.start()
+    if start and not match.string[start - 1].isspace():
+        # "tp.hcm" -> "tp. Hồ Chí Minh"
+        return " " + expansion
+    return expansion
+
+
+def expand_abbreviations(address):
+    """`address` with the `ADDRESS_ABBREVIATIONS` spelled out"""
+    return _ABBREVIATION_REGEX.sub(_expand, address)
@@ -0,0 +1,159 @@
+import re
+
+LEGACY_FIELDS = ("ctryname", "ctrysubdivname", "ctrysubsubdivname")
+
+
+class ParsedAddress:
+    """Result of parsing one address.
+
+    `ctryname`, `ctrysubdivname` and `ctrysubsubdivname` are the parts of
+    the address text the parser picked, normalized as before; `to_dict()`
+    returns them in the original dict shape. On top of that each level
+    carries its gazetteer unit, when one matched: the integer ID
+    (`province_id`, `district_id`, `ward_id`), the canonical accented name
+    (`province`, `district`, `ward`) and the match score out of 100, 100
+    meaning an exact spelling.
+
+    `text` is the cleaned address the parts were found in: country names
+    removed, abbreviations such as "tphcm" expanded, dots dropped. It is not
+    the string the caller passed, and `spans` gives character ranges in
+    `text` only. Results are shared between callers (and the result cache),
+    so treat them as read-only.
+    """
+
+    __slots__ = (
+        "text",
+        "ctryname",
+        "ctrysubdivname",
+        "ctrysubsubdivname",
+        "source",
+        "province_id",
+        "district_id",
+        "ward_id",
+        "province",
+        "district",
+        "ward",
+        "province_score",
+        "district_score",
+        "ward_score",
+        "_spans",
+    )
+
+    def __init__(
+        self,
+        text="",
+        ctryname="",
+        ctrysubdivname="",
+        ctrysubsubdivname=(),
+        source=None,
+        province_id=None,
+        district_id=None,
+        ward_id=None,
+        province=None,
+        district=None,
+        ward=None,
+        province_score=None,
+        district_score=None,
+        ward_score=None,
+    ):
+        self.text = text
+        self.ctryname = ctryname
+        # Lists become tuples so a shared result can't be changed in place
+        self.ctrysubdivname = tuple(ctrysubdivname) if isinstance(ctrysubdivname, list) else ctrysubdivname
+        self.ctrysubsubdivname = tuple(ctrysubsubdivname)
+        self.source = source
+        self.province_id = province_id
+        self.district_id = district_id
+        self.ward_id = ward_id
+        self.province = province
+        self.district = district
+        self.ward = ward
+        self.province_score = province_score
+        self.district_score = district_score
+        self.ward_score = ward_score
+        self._spans = None
+
+    def __repr__(self):
+        return (
+            f"ParsedAddress(province={self.province!r}, district={self.district!r}, "
+            f"ward={self.ward!r}, ids=({self.province_id}, {self.district_id}, {self.ward_id}))"
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, ParsedAddress):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__ if name != "_spans"
+        )
+
+    @property
+    def ids(self):
+        return self.province_id, self.district_id, self.ward_id
+
+    @property
+    def scores(self):
+        return {
+            "province": self.province_score,
+            "district": self.district_score,
+            "ward": self.ward_score,
+        }
+
+    @property
+    def spans(self):
+        """{field: (start, end) in the cleaned `text`} for the legacy fields found in it.
+
+        A part is searched for as spelled, ignoring case and spacing, so one
+        the parser rewrote (an expanded prefix such as "q1" -> "quận 1", or
+        the gazetteer name a fuzzy match was replaced with) has no span.
+        """
+        if self._spans is None:
+            spans = {}
+            for field in LEGACY_FIELDS:
+                span = _find_span(self.text, _first(getattr(self, field)))
+                if span is not None:
+                    spans[field] = span
+            self._spans = spans
+        return self._spans
+
+    def to_dict(self) -> dict:
+        """The dict `parse_address` used to return"""
+        result = {
+            "ctryname": self.ctryname,
+            "ctrysubdivname": list(self.ctrysubdivname) if isinstance(self.ctrysubdivname, tuple) else self.ctrysubdivname,
+            "ctrysubsubdivname": list(self.ctrysubsubdivname),
+        }
+        if self.source is not None:
+            result["source"] = self.source
+        return result
+
+    # Read access by the old dict keys, for code not yet moved to attributes
+    def __getitem__(self, key):
+        try:
+            return self.to_dict()[key]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return self.to_dict().get(key, default)
+
+
+def _first(value):
+    if isinstance(value, tuple):
+        return value[0] if value else ""
+    return value
+
+
+def _find_span(text, part):
+    # Parts are lowercased with whitespace collapsed, so match them loosely
+    if not text or not part:
+        return None
+
+    words = part.split()
+    if not words:
+        return None
+    pattern = r"\s+".join(re.escape(word) for word in words)
+    m = re.search(pattern, text, flags=re.IGNORECASE)
+    if m is None:
+        return None
+    return m.start(), m.end()
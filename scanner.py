@@ -0,0 +1,245 @@
+"""Single-pass exact gazetteer matching over a raw address string.
+
+Every province, district and ward name (accented and unaccented, with and
+without its admin prefix, plus the SPECIAL_PROVINCE_MAP aliases) is compiled
+into one word-level Aho-Corasick automaton. `scan` walks the folded tokens of
+an address once and reports every exact name occurrence with its character
+span in the original string, commas or not.
+"""
+import re
+import threading
+import unicodedata
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from data import SPECIAL_PROVINCE_MAP_FULL, PROVINCE_PREFIX_REGEX
+from gazetteer import LEVEL_PREFIX_REGEX, load_gazetteer
+from prefixes import get_classifier
+from utils import normalize_string, normalize_vietnamese
+
+TOKEN_REGEX = re.compile(r"[\w\u0300-\u036f]+")
+
+GazetteerEntry = namedtuple("GazetteerEntry", ["level", "province_id", "name", "accented"])
+
+GazetteerMatch = namedtuple(
+    "GazetteerMatch",
+    ["start", "end", "level", "province_id", "name", "accent_exact"],
+)
+
+
+def tokenize(text):
+    """Word tokens of `text` as (folded, accented, start, end) tuples"""
+    tokens = []
+    for m in TOKEN_REGEX.finditer(text):
+        word = m.group()
+        tokens.append((
+            normalize_vietnamese(word),
+            unicodedata.normalize("NFC", word.lower()),
+            m.start(),
+            m.end(),
+        ))
+    return tokens
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over token sequences.
+
+    `add` registers a pattern (a tuple of tokens) with a payload, `build`
+    computes the failure links, and `iter_matches` yields
+    (first_token, last_token, payloads) for every occurrence in one pass.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+
+    def add(self, pattern, payload):
+        node = 0
+        for token in pattern:
+            next_node = self.goto[node].get(token)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][token] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            node = next_node
+        self.outputs[node].append((len(pattern), payload))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                queue.append(child)
+
+                fallback = self.fail[node]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(token, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def iter_matches(self, tokens):
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(token, 0)
+            for length, payload in self.outputs[node]:
+                yield i - length + 1, i, payload
+
+
+def _name_variants(name, prefix_regex):
+    stripped = prefix_regex.sub("", name)
+    variants = {name}
+    # Bare numbers and very short names ("1", "an") would match all over the place
+    if stripped != name and len(stripped) >= 3 and not stripped.isdigit():
+        variants.add(stripped)
+    return variants
+
+
+class GazetteerScanner:
+    def __init__(self, gazetteer=None):
+        gazetteer = gazetteer or load_gazetteer()
+        self.gazetteer = gazetteer
+        self.automaton = AhoCorasick()
+        self._patterns = set()
+
+        for province_id, province in enumerate(gazetteer.province_names):
+            for variant in _name_variants(province, PROVINCE_PREFIX_REGEX):
+                self._add(GazetteerEntry("province", province_id, province, variant))
+
+            for level in ("district", "ward"):
+                for unit_id in gazetteer.children(level, province_id):
+                    name = gazetteer.name(level, unit_id)
+                    for variant in _name_variants(name, LEVEL_PREFIX_REGEX[level]):
+                        self._add(GazetteerEntry(level, province_id, name, variant))
+
+        for alias, province in SPECIAL_PROVINCE_MAP_FULL.items():
+            province_id = gazetteer.province_id(normalize_string(province))
+            if province_id is None:
+                province_id = gazetteer.province_id(normalize_vietnamese(province))
+            if province_id is None:
+                continue  # The aliases must spell out a data set province to be exact
+            self._add(GazetteerEntry("province", province_id, gazetteer.province_names[province_id], alias))
+
+        self.automaton.build()
+        del self._patterns
+
+    def _add(self, entry):
+        pattern = tuple(token for token, _, _, _ in tokenize(entry.accented))
+        key = (pattern, entry.level, entry.province_id, entry.name)
+        if pattern and key not in self._patterns:
+            self._patterns.add(key)
+            self.automaton.add(pattern, entry)
+
+    def _prefix_start(self, tokens, first, level):
+        # Pull an admin prefix such as "TP." or "Quận" written before a
+        # stripped name into the match; the prefixes are those of the
+        # current PREFIX_RULES
+        for prefix in get_classifier().level_prefixes(level):
+            start = first - len(prefix)
+            if start >= 0 and tuple(token[0] for token in tokens[start:first]) == prefix:
+                return start
+        return first
+
+    def scan(self, text):
+        """Every exact gazetteer name in `text`, as GazetteerMatch tuples"""
+        tokens = tokenize(text)
+        matches = {}
+        for first, last, entry in self.automaton.iter_matches([token[0] for token in tokens]):
+            accented = " ".join(token[1] for token in tokens[first:last + 1])
+            if LEVEL_PREFIX_REGEX[entry.level].sub("", entry.accented) == entry.accented:
+                first = self._prefix_start(tokens, first, entry.level)
+
+            match = GazetteerMatch(
+                tokens[first][2],
+                tokens[last][3],
+                entry.level,
+                entry.province_id,
+                entry.name,
+                accented == unicodedata.normalize("NFC", entry.accented),
+            )
+            # A full name and its stripped form extended over the same prefix
+            # are one match; keep the accent-exact one
+            key = match[:5]
+            if key not in matches or match.accent_exact:
+                matches[key] = match
+
+        return sorted(matches.values(), key=lambda m: (m.start, -m.end))
+
+    def split(self, text):
+        """Split an address into parts at gazetteer matches.
+
+        Keeps the longest match at each position, drops matches overlapping an
+        earlier one, and cuts the text at the start of every kept match, so an
+        address written without commas comes out as comma-style parts.
+        """
+        cuts = []
+        end = -1
+        for match in self.scan(text):
+            if match.start >= end:
+                cuts.append(match.start)
+                end = match.end
+
+        if not cuts or cuts[0] != 0:
+            cuts.insert(0, 0)
+        cuts.append(len(text))
+
+        parts = []
+        for start, end in zip(cuts, cuts[1:]):
+            part = text[start:end].strip(" ,-")
+            if part:
+                parts.append(part)
+        return parts
+
+
+# Scanners of the active gazetteer and the one before it, so parses still
+# running on the old data after a reload don't rebuild its automaton
+_scanners = ()
+_scanner_lock = threading.Lock()
+
+
+# A scanner used instead of the cached ones in the current context
+_pinned_scanner = ContextVar("gazetteer_scanner", default=None)
+
+
+@contextmanager
+def using_scanner(scanner):
+    """Scan with `scanner` in the enclosed code when its gazetteer is asked for"""
+    token = _pinned_scanner.set(scanner)
+    try:
+        yield scanner
+    finally:
+        _pinned_scanner.reset(token)
+
+
+def get_scanner(gazetteer=None):
+    """The scanner of `gazetteer`, by default the active one"""
+    global _scanners
+    gazetteer = gazetteer or load_gazetteer()
+    scanner = _pinned_scanner.get()
+    if scanner is not None and scanner.gazetteer is gazetteer:
+        return scanner
+    for scanner in _scanners:
+        if scanner.gazetteer is gazetteer:
+            return scanner
+
+    with _scanner_lock:
+        # Another thread may have built it meanwhile
+        for scanner in _scanners:
+            if scanner.gazetteer is gazetteer:
+                return scanner
+        scanner = GazetteerScanner(gazetteer)
+        _scanners = (scanner,) + _scanners[:1]
+    return scanner
+
+
+def scan(text, gazetteer=None):
+    return get_scanner(gazetteer).scan(text)
+
+
+def split_address(text, gazetteer=None):
+    return get_scanner(gazetteer).split(text)
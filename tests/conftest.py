@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ner  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def stub_backend():
+    # Every comma-separated segment is one LOCATION entity; no model is loaded
+    previous = ner._backend
+    ner.set_backend(ner.StubBackend())
+    yield
+    ner.set_backend(previous)
@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ner
+import parser
+import scanner
+from address_parser import AddressParser
+from gazetteer import build_gazetteer
+
+ADDRESSES = [
+    "Phường Bến Thành, Quận 1, TP. Hồ Chí Minh",
+    "Xã Ninh Thạnh Lợi, Huyện Hồng Dân, Bạc Liêu",
+    "123 Xuân Thủy, Phú Nhuận, TP. Hồ Chí Minh",
+    "Phường 5, Quận 3, Hồ Chí Minh",
+    "Thị trấn Phú Mỹ, Huyện Tân Thành, Bà Rịa - Vũng Tàu",
+] * 20
+
+
+class SlowBackend(ner.StubBackend):
+    """Fails if two threads are ever inside `predict` at once"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def predict(self, texts, batch_size=32):
+        if not self.lock.acquire(blocking=False):
+            raise AssertionError("concurrent model access")
+        try:
+            self.calls += 1
+            time.sleep(0.002)
+            return super().predict(texts, batch_size)
+        finally:
+            self.lock.release()
+
+
+def test_threads_share_one_serialized_model():
+    expected = [parser.parse_address(address) for address in ADDRESSES]
+    backend = SlowBackend()
+    with AddressParser(backend=backend, max_wait_ms=5) as address_parser:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(address_parser.parse, ADDRESSES))
+        assert results == expected
+        assert address_parser.parse_many(ADDRESSES, batch_size=16) == expected
+    assert backend.calls < len(ADDRESSES)
+
+
+def test_concurrent_parse_and_close_never_hangs():
+    address_parser = AddressParser(backend=SlowBackend(), max_wait_ms=1)
+    stop = threading.Event()
+
+    def close_repeatedly():
+        while not stop.is_set():
+            address_parser.close()
+            time.sleep(0.001)
+
+    closer = threading.Thread(target=close_repeatedly)
+    closer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(address_parser.parse, address) for address in ADDRESSES]
+            for future in futures:
+                try:
+                    future.result(timeout=10)
+                except RuntimeError:
+                    # Failed by a close, rather than left waiting
+                    pass
+    finally:
+        stop.set()
+        closer.join()
+        address_parser.close()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_a_dead_worker_fails_its_callers():
+    class Fatal(BaseException):
+        pass
+
+    class Dying(ner.NerBackend):
+        def predict(self, texts, batch_size=32):
+            raise Fatal()
+
+    before = set(threading.enumerate())
+    backend = ner.BatchingBackend(Dying())
+    with pytest.raises(Fatal):
+        backend.predict(["xyz"])
+    # A new worker takes over
+    with pytest.raises(Fatal):
+        backend.predict(["xyz"])
+    backend.close()
+    for worker in set(threading.enumerate()) - before:
+        worker.join()
+
+
+def test_parser_keeps_its_scanner_across_reloads(monkeypatch):
+    with AddressParser(cascade=True) as address_parser:
+        for _ in range(2):
+            scanner.get_scanner(build_gazetteer())
+
+        built = []
+        original = scanner.GazetteerScanner
+        monkeypatch.setattr(scanner, "GazetteerScanner", lambda gazetteer: built.append(gazetteer) or original(gazetteer))
+        address_parser.parse("Bến Thành Quận 1 Hồ Chí Minh")
+        assert built == []
+
+
+def test_parsers_over_one_backend_take_turns():
+    expected = [parser.parse_address(address) for address in ADDRESSES]
+    backend = SlowBackend()
+    with AddressParser(backend=backend, max_wait_ms=1) as first, AddressParser(backend=backend, max_wait_ms=1) as second:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(
+                lambda args: args[0].parse(args[1]),
+                [(first if i % 2 else second, address) for i, address in enumerate(ADDRESSES)],
+            ))
+    assert results == expected
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import ner
+import parser
+from async_parser import AsyncAddressParser
+from instrumentation import MetricsRecorder, recording
+
+ADDRESS = "Phường Bến Thành, Quận 1, TP. Hồ Chí Minh"
+
+
+def test_parse_runs_in_the_callers_context():
+    async def main():
+        async with AsyncAddressParser(max_wait_ms=1) as async_parser:
+            with recording(MetricsRecorder()) as recorder:
+                result = await async_parser.parse(ADDRESS)
+        return result, recorder
+
+    result, recorder = asyncio.run(main())
+    assert result == parser.parse_address(ADDRESS)
+    assert recorder.snapshot()["stage_calls"]["ner"] == 1
+
+
+def test_parse_uses_a_backend_pinned_by_the_caller():
+    class Empty(ner.NerBackend):
+        def predict(self, texts, batch_size=32):
+            return [[] for _ in texts]
+
+    async def main():
+        async with AsyncAddressParser(max_wait_ms=1) as async_parser:
+            with ner.using_backend(Empty()):
+                pinned = await async_parser.parse("Quận 1, Hồ Chí Minh, xyz")
+            default = await async_parser.parse("Quận 1, Hồ Chí Minh, xyz")
+        return pinned, default
+
+    pinned, default = asyncio.run(main())
+    assert pinned != default
+
+
+def test_close_drains_or_fails_queued_requests():
+    async def main(drain):
+        async_parser = AsyncAddressParser(max_wait_ms=1)
+        await async_parser.start()
+        pending = [asyncio.ensure_future(async_parser.parse(ADDRESS)) for _ in range(5)]
+        await asyncio.sleep(0)
+        await async_parser.close(drain=drain)
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    assert all(not isinstance(result, Exception) for result in asyncio.run(main(True)))
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main(False)))
+
+
+def test_parse_fails_once_the_worker_died():
+    class Fatal(BaseException):
+        pass
+
+    class Dying(ner.NerBackend):
+        def predict(self, texts, batch_size=32):
+            raise Fatal()
+
+    async def main():
+        async_parser = AsyncAddressParser(max_wait_ms=1)
+        with ner.using_backend(Dying()):
+            with pytest.raises(Fatal):
+                await async_parser.parse("xyz")
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(async_parser.parse(ADDRESS), 5)
+        await async_parser.close()
+
+    asyncio.run(main())
@@ -0,0 +1,11 @@
+from autocomplete import complete
+
+
+def test_complete_in_a_province():
+    assert complete("ben th", level="ward", province=4)[0].name == "phường bến thành"
+
+
+def test_unknown_province_completes_nothing():
+    assert complete("ben", level="district", province=999) == []
+    assert complete("ben", level="district", province=-1) == []
+    assert complete("ben", level="district", province="nowhere") == []
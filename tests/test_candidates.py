@@ -0,0 +1,34 @@
+import parser
+from fuzzy_index import FuzzyIndex
+
+
+def test_extract_top_with_no_limit():
+    index = FuzzyIndex(["phuong ben thanh", "phuong ben nghe"])
+    assert index.extract_top("ben thanhh", limit=0) == []
+    assert index.extract_top("ben thanhh", limit=-1) == []
+
+
+def test_candidates_with_no_limit():
+    assert parser.candidates("ben thanhh", "ward", limit=0) == []
+    assert parser.candidates("ben thanhh", "ward", limit=1)[0].name == "phường bến thành"
+
+
+def test_candidates_in_an_unknown_province():
+    assert parser.candidates("ben thanhh", "ward", province=10 ** 6) == []
+    assert parser.candidates("ben thanhh", "ward", province=-1) == []
+
+
+def test_candidates_without_a_province_search_every_province():
+    found = parser.candidates("ben thanhh", "ward")
+    assert found[0].name == "phường bến thành"
+    assert len({candidate.province_id for candidate in found}) > 1
+
+    in_province = parser.candidates("ben thanhh", "ward", province=found[0].province_id, limit=1)
+    assert in_province == found[:1]
+
+
+def test_candidates_expand_abbreviations():
+    found = parser.candidates("tphcm", "province", limit=1)
+    assert [(c.name, c.score, c.tier) for c in found] == [("thành phố hồ chí minh", 100, "exact")]
+    assert parser.candidates("tp.hcm", "province", limit=1) == found
+    assert parser.candidates("Q.1", "district", province=found[0].id, limit=1)[0].name == "quận 1"
@@ -0,0 +1,61 @@
+import parser
+from convert import ConversionIndex, convert_address, convert_addresses
+
+WARD_ROWS = [
+    {
+        "old_province": "Thành phố Hồ Chí Minh",
+        "old_district": "Quận 1",
+        "old_ward": "Phường Bến Nghé",
+        "new_province": "Thành phố Hồ Chí Minh",
+        "new_ward": "Phường Sài Gòn",
+    },
+    {
+        "old_province": "Thành phố Hồ Chí Minh",
+        "old_district": None,
+        "old_ward": None,
+        "new_province": "Thành phố Hồ Chí Minh",
+        "new_ward": None,
+    },
+]
+
+
+def test_current_address():
+    conversion = convert_address("Phường Bến Thành, Thành phố Hồ Chí Minh")
+    assert conversion.level == "current"
+    assert (conversion.province, conversion.ward) == ("thành phố hồ chí minh", "phường bến thành")
+
+
+def test_old_address_without_a_recognised_district_is_not_current():
+    conversion = convert_address("Phường Bến Nghé, TP HCM")
+    assert conversion.address.district_id is None and conversion.address.ward_id is None
+    assert conversion.level == "province"
+    assert (conversion.province, conversion.ward) == ("thành phố hồ chí minh", None)
+
+
+def test_old_province_moves_to_the_new_one():
+    conversion = convert_address("Xã Foo, Tỉnh Long An")
+    assert (conversion.province, conversion.ward, conversion.level) == ("tỉnh tây ninh", None, "province")
+
+
+def test_old_ward_to_new_ward():
+    index = ConversionIndex(WARD_ROWS)
+    conversion = index.convert(parser.parse_address("Phường Bến Nghé, Quận 1, TP HCM"))
+    assert (conversion.province, conversion.ward, conversion.level) == (
+        "thành phố hồ chí minh",
+        "phường sài gòn",
+        "ward",
+    )
+    # Other wards of the district fall back to the province row
+    conversion = index.convert(parser.parse_address("Phường Đa Kao, Quận 1, TP HCM"))
+    assert (conversion.ward, conversion.level) == (None, "province")
+
+
+def test_unknown_address():
+    conversion = convert_address("Atlantis, Narnia")
+    assert conversion[1:] == (None,) * 5
+
+
+def test_convert_addresses_keeps_input_order():
+    addresses = ["Atlantis, Narnia", "Phường Bến Thành, Thành phố Hồ Chí Minh", "Xã Foo, Tỉnh Long An"]
+    levels = [conversion.level for conversion in convert_addresses(addresses, batch_size=2)]
+    assert levels == [None, "current", "province"]
@@ -0,0 +1,49 @@
+import parser
+from gazetteer import Gazetteer
+
+
+def _ward_names(province_id):
+    gazetteer = parser.GAZETTEER
+    children = gazetteer.children("ward", province_id)
+    return set(gazetteer.names["ward"][children.start:children.stop])
+
+
+def test_search_unit_reuses_the_index_of_a_choice_set():
+    names = _ward_names(4)
+    parser._search_index.cache_clear()
+    first = parser.fuzzy_search_ward("phường bến thànhh", names)
+    second = parser.fuzzy_search_ward("phường bến thànhh", set(names))
+    assert first == second == "phường bến thành"
+    assert parser._search_index.cache_info().misses == 1
+
+
+def test_search_unit_uses_a_gazetteer_shard_as_is():
+    shard = parser.GAZETTEER.ward_shards[4]
+    index, _ = parser._search_index(shard)
+    assert index is shard
+    assert parser.fuzzy_search_ward("phuong ben thanhh", shard) == "phuong ben thanh"
+
+
+def test_resolve_unit_keeps_the_unit_picked_by_accents():
+    gazetteer = Gazetteer(
+        ["Tỉnh Ninh Bình"],
+        [],
+        [("Tỉnh Ninh Bình", "Xã Hòa An"), ("Tỉnh Ninh Bình", "Xã Hóa An")],
+    )
+    token = parser._pinned_gazetteer.set(gazetteer)
+    try:
+        assert parser._resolve_unit("ward", "xã hóa an", 0) == (1, 100)
+        assert parser._resolve_unit("ward", "xã hòa an", 0) == (0, 100)
+        assert parser._resolve_unit("ward", "xa hoa an", 0) == (0, 100)
+    finally:
+        parser._pinned_gazetteer.reset(token)
+
+
+def test_resolve_unit_prefers_the_full_name_match():
+    # "phường an" is the full name of unit 1 and unit 0 without its prefix
+    gazetteer = Gazetteer(["Tỉnh Ninh Bình"], [], [("Tỉnh Ninh Bình", "Xã Phường An"), ("Tỉnh Ninh Bình", "Phường An")])
+    token = parser._pinned_gazetteer.set(gazetteer)
+    try:
+        assert parser._resolve_unit("ward", "phường an", 0) == (1, 100)
+    finally:
+        parser._pinned_gazetteer.reset(token)
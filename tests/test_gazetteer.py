@@ -0,0 +1,33 @@
+import re
+
+import gazetteer
+from utils import normalize_vietnamese
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "gazetteer.snapshot")
+    written = gazetteer.write_snapshot(path)
+    loaded = gazetteer.read_snapshot(path)
+    assert loaded is not None
+    assert loaded.version == written["gazetteer"].version
+
+
+def test_fingerprint_covers_the_data_py_tables(monkeypatch):
+    before = gazetteer.source_fingerprint()
+    aliases = dict(gazetteer.SPECIAL_PROVINCE_MAP_FULL, **{"sai gon": "Hồ Chí Minh"})
+    monkeypatch.setattr(gazetteer, "SPECIAL_PROVINCE_MAP_FULL", aliases)
+    assert gazetteer.source_fingerprint() != before
+
+    monkeypatch.undo()
+    monkeypatch.setattr(gazetteer, "WARD_PREFIX_REGEX", re.compile(r"^phường\s*"))
+    assert gazetteer.source_fingerprint() != before
+
+
+def test_province_ties_do_not_depend_on_set_order():
+    provinces = ["Tỉnh Hà Nam", "Tỉnh Nam Định", "Thành phố Hà Nội"]
+    lookups = [
+        [normalize_vietnamese(name) for name in provinces],
+        [normalize_vietnamese(name) for name in reversed(provinces)],
+    ]
+    indexes = [gazetteer.Gazetteer(provinces, [], [], province_lookup=lookup).province_index for lookup in lookups]
+    assert indexes[0].choices == indexes[1].choices
@@ -0,0 +1,17 @@
+import parser
+from instrumentation import MetricsRecorder, recording
+
+
+def test_memoized_matches_are_recorded_on_every_parse():
+    parser._match_unit.cache_clear()
+    snapshots = []
+    for _ in range(2):
+        recorder = MetricsRecorder()
+        with recording(recorder):
+            parser.parse_address("bến thành, hồ chí minh")
+        snapshots.append(recorder.snapshot())
+
+    first, second = snapshots
+    assert first["matches"]["ward.fuzzy"] == 1
+    assert second["matches"] == first["matches"]
+    assert second["scores"] == first["scores"]
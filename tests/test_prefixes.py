@@ -0,0 +1,66 @@
+import pytest
+
+import parser
+from cache import approx_size
+from data import PREFIX_RULES
+from prefixes import classify_segment, set_prefix_rules, split_glued_prefixes
+from scanner import scan
+
+EXTRA_RULES = PREFIX_RULES + [("ph", ("ward",), "phường")]
+
+
+@pytest.fixture
+def extra_rules():
+    set_prefix_rules(EXTRA_RULES)
+    yield
+    set_prefix_rules(PREFIX_RULES)
+
+
+def test_classify_expands_abbreviations():
+    assert classify_segment("Q.1") == ("quận 1", frozenset({"district"}))
+    assert classify_segment("p5") == ("phường 5", frozenset({"ward"}))
+    assert classify_segment("long an").levels == frozenset()
+
+
+def test_new_rules_reach_the_classifier_and_scanner(extra_rules):
+    assert classify_segment("ph bến thành") == ("phường bến thành", frozenset({"ward"}))
+    ward = next(match for match in scan("ph bến thành quận 1") if match.level == "ward")
+    assert ward.start == 0
+
+
+def test_result_cache_is_keyed_by_the_rules():
+    parser.enable_cache()
+    try:
+        before = parser.parse_address("ph bến thành, quận 1, hồ chí minh")
+        set_prefix_rules(EXTRA_RULES)
+        try:
+            after = parser.parse_address("ph bến thành, quận 1, hồ chí minh")
+        finally:
+            set_prefix_rules(PREFIX_RULES)
+    finally:
+        parser.disable_cache()
+    assert before.ctrysubsubdivname == ("ph bến thành",)
+    assert after.ctrysubsubdivname == ("phường bến thành",)
+
+
+def test_cache_key_stays_small():
+    # The key names the rules, it doesn't carry their tables
+    assert approx_size(parser._cache_key("phường bến thành, hồ chí minh", False)) < 1024
+
+
+def test_glued_dotted_prefixes():
+    result = parser.parse_address("P.Long Hưng, TX.Sơn Tây, TP.Hà Nội")
+    assert result.ctryname == "thành phố hà nội"
+    assert result.ctrysubdivname == "thị xã sơn tây"
+    assert result.ctrysubsubdivname == ("phường long hưng",)
+
+    assert parser.parse_address("P.Kỳ Sơn, Tỉnh Phú Thọ").ward == "phường kỳ sơn"
+
+    result = parser.parse_address("TT.Phú Mỹ, H.Tân Thành, T.Bà Rịa - Vũng Tàu")
+    assert result.ctrysubdivname == "huyện tân thành"
+    assert result.ctrysubsubdivname == ("thị trấn phú mỹ",)
+
+
+def test_glued_numbers_and_names_are_kept():
+    assert split_glued_prefixes("Q.1, P.Bến Thành, Đ.Lê Lợi") == "Q.1, P. Bến Thành, Đ.Lê Lợi"
+    assert split_glued_prefixes("Lê.Lợi, Hà.Nội, ATP.Long") == "Lê.Lợi, Hà.Nội, ATP.Long"
@@ -0,0 +1,141 @@
+import random
+
+from data import DASH_CASES
+from parser import BUILDING_PREFIXES, DASH_CASES_NORMALIZED, handle_dash, handle_dup_substr, remove_redunts
+from utils import has_number, normalize_vietnamese
+
+
+# The preprocessing as it was before it was made linear, kept as the reference
+
+
+def baseline_handle_dup_substr(str):
+    try:
+        for i in range(len(str) // 2, -1, -1):
+            idx = str[i:].find(str[:i])
+            if idx != -1 and idx < 5 and str[i] == ",":
+                return str[i + idx :]
+        return str
+    except IndexError:
+        return str
+
+
+def baseline_remove_redunts(str):
+    str_list = [x for x in str.split(",") if x.strip() != ""]
+    res = ""
+    for sub_str in str_list:
+        res += sub_str + ","
+    return res[:-1].strip()
+
+
+def baseline_handle_dash(str):
+    if "-" not in str:
+        return str
+    sub_str_list = str.split("-")
+    new_str = ""
+    for i, sub_str in enumerate(sub_str_list):
+        if i == len(sub_str_list) - 1:
+            new_str += sub_str
+            continue
+
+        substr_before_dash = "".join(e for e in sub_str.strip().split(" ")[-1] if e.isalnum())
+        substr_after_dash = "".join(e for e in sub_str_list[i + 1].strip().split(" ")[0] if e.isalnum())
+
+        should_keep_dash = False
+        current_part_lower = sub_str.lower()
+        next_part_lower = sub_str_list[i + 1].lower()
+        current_part_normalized = normalize_vietnamese(sub_str).lower()
+        next_part_normalized = normalize_vietnamese(sub_str_list[i + 1]).lower()
+        for case_orig, case_norm in zip(DASH_CASES, DASH_CASES_NORMALIZED):
+            if case_orig[0].lower() in current_part_lower and case_orig[1].lower() in next_part_lower:
+                should_keep_dash = True
+                break
+            if case_norm[0] in current_part_normalized and case_norm[1] in next_part_normalized:
+                should_keep_dash = True
+                break
+
+        if (
+            should_keep_dash
+            or (has_number(substr_before_dash) and has_number(substr_after_dash))
+            or (len(substr_after_dash) <= 2 and substr_after_dash.lower() not in BUILDING_PREFIXES)
+        ):
+            new_str += sub_str + "-"
+        else:
+            new_str += sub_str + ","
+    return new_str
+
+
+FIXED = [
+    "",
+    ",",
+    ",,,",
+    "-",
+    "--",
+    " - , - ",
+    "Số 12, Lê Lợi, Số 12, Lê Lợi, Quận 1, Hồ Chí Minh",
+    "Quận 1, Quận 1, Hồ Chí Minh",
+    "a,a,a,a,a,a",
+    "ab, ab,ab",
+    "Hồ Chí Minh,Hồ Chí Minh",
+    "x,  x, y",
+    "12-14 Lê Lợi, P. Bến Nghé",
+    "CT-3 Linh Đàm, Hoàng Mai, Hà Nội",
+    "HH-1A, Hoàng Mai",
+    "Bà Rịa - Vũng Tàu",
+    "Ba Ria-Vung Tau",
+    "bà rịa-vũng tàu-bà rịa-vũng tàu",
+    "Phan Rang - Tháp Chàm, Ninh Thuận",
+    "Thừa Thiên - Huế",
+    "Cam Ly - Đà Lạt, Lâm Đồng",
+    "Sao Bọng - Đăng Hà",
+    "Lang Biang-Đà Lạt",
+    "Xuân Hương - Đà Lạt - Lâm Đồng",
+    "Thôn 3 - Xã An Phú - Huyện X",
+    "Ngõ 5 - ab - Hà Nội",
+    "Lô A1-A2 - KCN Tân Bình",
+    "a-b-c-d-e",
+    "tháp chàm - phan rang",
+]
+
+WORDS = [
+    "Số", "12", "12A", "Lê", "Lợi", "Phường", "Bến", "Nghé", "Quận", "1", "Hồ", "Chí", "Minh",
+    "Bà", "Rịa", "Vũng", "Tàu", "Thừa", "Thiên", "Huế", "Phan", "Rang", "Tháp", "Chàm", "Đà", "Lạt",
+    "ct", "HH", "bt", "ps", "ab", "x", "P", "Q", "TP", "CAM", "ly", "Xuân", "Hương", "Lang", "Biang",
+]
+SEPARATORS = [" ", " ", " ", ", ", ",", " - ", "-", ",,", " , ", "--"]
+
+
+def random_address(rng, words):
+    text = "".join(rng.choice(WORDS) + rng.choice(SEPARATORS) for _ in range(words)).strip()
+    if rng.random() < 0.4:
+        # A duplicated leading run, as copy-pasted input often has
+        cut = text.find(",", rng.randrange(len(text))) if text else -1
+        if cut > 0:
+            text = text[:cut] + "," + rng.choice(["", " ", "  "]) + text
+    return text
+
+
+def corpus():
+    rng = random.Random(16)
+    inputs = list(FIXED)
+    inputs += [random_address(rng, rng.randint(1, 12)) for _ in range(2000)]
+    # 1-2 KB inputs
+    inputs += [random_address(rng, rng.randint(130, 230)) for _ in range(20)]
+    return inputs
+
+
+def test_corpus_has_long_and_duplicated_inputs():
+    inputs = corpus()
+    assert max(len(text.encode()) for text in inputs) >= 1024
+    assert sum(baseline_handle_dup_substr(text) != text for text in inputs) > 100
+    assert sum(baseline_handle_dash(text) != text for text in inputs) > 100
+
+
+def test_preprocessing_matches_the_baseline():
+    for text in corpus():
+        assert handle_dup_substr(text) == baseline_handle_dup_substr(text), text
+        assert remove_redunts(text) == baseline_remove_redunts(text), text
+        assert handle_dash(text) == baseline_handle_dash(text), text
+
+        cleaned = remove_redunts(handle_dup_substr(text))
+        assert cleaned == baseline_remove_redunts(baseline_handle_dup_substr(text)), text
+        assert handle_dash(cleaned) == baseline_handle_dash(cleaned), text
@@ -0,0 +1,52 @@
+import unicodedata
+
+from utils import normalize_string, normalize_vietnamese
+
+BASE_VOWELS = "aăâeêioôơuưy"
+# grave, acute, hook above, tilde, dot below
+TONE_MARKS = "\u0300\u0301\u0309\u0303\u0323"
+
+
+def reference(text):
+    # normalize_vietnamese as it was before the translate table
+    if not text:
+        return text
+    result = "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+    result = result.replace("đ", "d").replace("Đ", "D")
+    return normalize_string(result)
+
+
+def vietnamese_letters():
+    letters = ["đ", "Đ"]
+    for vowel in BASE_VOWELS:
+        for tone in [""] + list(TONE_MARKS):
+            letter = unicodedata.normalize("NFC", vowel + tone)
+            letters += [letter, letter.upper()]
+    return letters
+
+
+def test_every_vietnamese_letter_matches_the_reference():
+    letters = vietnamese_letters()
+    assert len(letters) == 2 + 2 * len(BASE_VOWELS) * 6
+    for letter in letters:
+        for form in ("NFC", "NFD"):
+            text = unicodedata.normalize(form, letter)
+            assert normalize_vietnamese(text) == reference(text), (form, letter)
+
+
+def test_words_match_the_reference():
+    words = [
+        "Thành phố Hồ Chí Minh",
+        "  Phường   Bến Nghé ",
+        "Xã Đắk Rơ Wa",
+        "THỪA THIÊN - HUẾ",
+        "Quận 1, TP.HCM",
+        "Ấp Mỹ Hòa 2",
+        "Ω street №5",
+        "",
+    ]
+    words.append("".join(vietnamese_letters()))
+    for word in words:
+        for form in ("NFC", "NFD"):
+            text = unicodedata.normalize(form, word)
+            assert normalize_vietnamese(text) == reference(text), (form, word)
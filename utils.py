@@ -1,4 +1,7 @@
 import unicodedata
+from functools import lru_cache
+
+NORMALIZE_CACHE_SIZE = 16384
 
 
 def normalize_string(text: str) -> str:
@@ -13,9 +16,7 @@ def normalize_string(text: str) -> str:
     return result
 
 
-def normalize_vietnamese(text: str) -> str:
-    if not text:
-        return text
+def _normalize_vietnamese_slow(text: str) -> str:
     # Document at: https://unicode.org/reports/tr15/
     # Remove all diacritics
     result = "".join(
@@ -28,6 +29,44 @@ def normalize_vietnamese(text: str) -> str:
     return normalize_string(result)
 
 
+def _build_unaccent_table():
+    # Per character results of the slow path for every Latin letter whose
+    # decomposition is ASCII plus nonspacing marks (all the precomposed
+    # Vietnamese letters), and the marks themselves for NFD input. A list
+    # indexed by code point translates faster than a dict; code points past
+    # its end raise IndexError and are kept as they are.
+    table = [chr(code) for code in range(0x2000)]
+    table[ord("đ")] = "d"
+    table[ord("Đ")] = "D"
+    for code in range(0x80, 0x2000):
+        c = chr(code)
+        if unicodedata.category(c) == "Mn":
+            table[code] = None
+            continue
+
+        decomposed = unicodedata.normalize("NFD", c)
+        base = "".join(d for d in decomposed if unicodedata.category(d) != "Mn")
+        if base != decomposed and base.isascii() and base.isalpha():
+            table[code] = base
+    return table
+
+
+UNACCENT_TABLE = _build_unaccent_table()
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_vietnamese(text: str) -> str:
+    if not text:
+        return text
+
+    result = text.translate(UNACCENT_TABLE)
+    if not result.isascii():
+        # Characters outside the table, only the full Unicode path is exact
+        return _normalize_vietnamese_slow(text)
+
+    return normalize_string(result)
+
+
 
 def has_number(str):
-    return any(char.isdigit() for char in str)
\ No newline at end of file
+    return any(char.isdigit() for char in str)